@@ -19,13 +19,31 @@ import p2pp.gui as gui
 import p2pp.mcf as mcf
 import p2pp.variables as v
 import version as ver
+from p2pp.context import ProcessingContext
 
 arguments = argparse.ArgumentParser(description='Generates MCF/Omega30 headers from an multi-tool/multi-extruder'
                                                 ' GCODE derived from Slic3r.')
 
-arguments.add_argument('-i',
-                       '--input-file',
-                       required=True)
+inputs = arguments.add_mutually_exclusive_group(required=True)
+inputs.add_argument('-i',
+                    '--input-file')
+inputs.add_argument('-b',
+                    '--batch',
+                    nargs='+',
+                    help='Process several files (names or glob patterns) in one run, in parallel.'
+                         ' Files are processed in place unless --output-dir is given'
+                    )
+inputs.add_argument('--watch',
+                    help='Run as a daemon that processes every .gcode file written to this directory.'
+                         ' Requires --output-dir'
+                    )
+inputs.add_argument('--serve',
+                    nargs='?',
+                    const='',
+                    metavar='SOCKET',
+                    help='Run as a resident server for p2ppclient.py, listening on a unix socket'
+                         ' (default ~/.p2pp.sock). Not available on Windows'
+                    )
 arguments.add_argument('-d',
                        '--output-file',
                        required=False)
@@ -69,6 +87,91 @@ arguments.add_argument('-w',
                        help='Wait for the user to press enter after processing the file. -w [0|1]'
                        )
 
+arguments.add_argument('--stats-json',
+                       required=False,
+                       help='Write the processing time per stage to this JSON file'
+                       )
+
+arguments.add_argument('--trace',
+                       required=False,
+                       help='Write a trace of the processing (stages, layers, blocks, splices, pings) to this file,'
+                            ' in Chrome trace event format (open with https://ui.perfetto.dev)'
+                       )
+
+arguments.add_argument('--profile',
+                       choices=['cpu', 'mem'],
+                       help='Profile the processing, cpu writes <output>.pstats and <output>.profile.txt,'
+                            ' mem writes <output>.memory.txt'
+                       )
+
+arguments.add_argument('--profile-top',
+                       type=int,
+                       default=25,
+                       help='Number of functions or lines in the profile reports'
+                       )
+
+arguments.add_argument('--workers',
+                       type=int,
+                       default=0,
+                       help='Number of worker processes used by --batch or --watch, defaults to the number of CPUs'
+                       )
+
+arguments.add_argument('--output-dir',
+                       required=False,
+                       help='Directory for the files processed by --batch or --watch'
+                       )
+
+arguments.add_argument('--log-dir',
+                       required=False,
+                       help='Directory for a log file per file processed by --batch or --watch,'
+                            ' --watch defaults to the output directory'
+                       )
+
+arguments.add_argument('--settle-time',
+                       type=float,
+                       default=2.0,
+                       help='--watch only picks up a file when it did not change for this many seconds'
+                       )
+
+
+def batch_main(args):
+    import p2pp.batch as batch
+    summary = batch.run_batch(args['batch'],
+                              args['workers'],
+                              args['output_dir'],
+                              args['printer_profile'],
+                              args['splice_offset'],
+                              args['log_dir']
+                              )
+    batch.print_summary(summary)
+    return summary
+
+
+def watch_main(args):
+    import p2pp.watch as watch
+    if not args['output_dir']:
+        arguments.error("--watch requires --output-dir")
+    if os.path.abspath(args['output_dir']) == os.path.abspath(args['watch']):
+        # the output would be picked up again as a new file
+        arguments.error("--output-dir must be a different directory than the watched one")
+    v.version = ver.Version
+    watch.run(args['watch'],
+              args['output_dir'],
+              args['workers'],
+              args['printer_profile'],
+              args['splice_offset'],
+              args['log_dir'],
+              settle_time=args['settle_time']
+              )
+
+
+def serve_main(args):
+    import p2pp.server as server
+    if not server.supported():
+        arguments.error("--serve needs fork and unix sockets, which this system does not have")
+    v.version = ver.Version
+    server.serve(args['serve'] or server.SOCKET_PATH)
+
 
 def main(args):
     if not args['nogui']:
@@ -84,13 +187,48 @@ def main(args):
     if args['wait'] == "1":
         v.consolewait = True
 
-    mcf.generate(v.filename,
-                 args['output_file'],
-                 args['printer_profile'],
-                 args['splice_offset'],
-                 args['silent']
-                 )
+    v.stats_json = args['stats_json']
+    v.trace_file = args['trace']
+
+    job = mcf.generate
+    if args['profile']:
+        import p2pp.profiling as profiling
+        if not profiling.supported(args['profile']):
+            gui.user_error("P2PP - Error Occurred", "Memory profiling needs tracemalloc (python 3.4 or later)")
+            return
+        name = os.path.splitext(args['output_file'] or v.filename)[0]
+        job = profiling.profiled(args['profile'], mcf.generate, name, args['profile_top'])
 
+    # the Tk front end runs the job on a worker thread and keeps the window responsive
+    gui.run_job(job,
+                ProcessingContext(),
+                v.filename,
+                args['output_file'],
+                args['printer_profile'],
+                args['splice_offset'],
+                args['silent']
+                )
+
+
+
+def report_version(MASTER_VERSION, DEV_VERSION):
+    if MASTER_VERSION and DEV_VERSION:
+
+        if v.version > MASTER_VERSION:
+            if v.version < DEV_VERSION:
+                v.version += " (New dev version {} available)".format(DEV_VERSION)
+                color = "red"
+            else:
+                v.version += " (Dev version up to date)"
+                color = "green"
+        else:
+            if v.version < MASTER_VERSION:
+                v.version += " (New stable version {} available)".format(MASTER_VERSION)
+                color = "red"
+            else:
+                v.version += " (Version up to date)"
+                color = "green"
+        gui.create_logitem(v.version, color , True, "1.0")
 
 
 if __name__ == "__main__":
@@ -98,27 +236,10 @@ if __name__ == "__main__":
 
     if len(sys.argv) == 1 or (len(sys.argv) == 2 and sys.argv[1] == "-i"):
         platformD = platform.system()
+        gui.select_backend(False)
 
-        MASTER_VERSION = checkversion.get_version(checkversion.MASTER)
-        DEV_VERSION = checkversion.get_version(checkversion.DEV)
-
-        if MASTER_VERSION and DEV_VERSION:
-
-            if v.version > MASTER_VERSION:
-                if v.version < DEV_VERSION:
-                    v.version += " (New dev version {} available)".format(DEV_VERSION)
-                    color = "red"
-                else:
-                    v.version += " (Dev version up to date)"
-                    color = "green"
-            else:
-                if v.version < MASTER_VERSION:
-                    v.version += " (New stable version {} available)".format(MASTER_VERSION)
-                    color = "red"
-                else:
-                    v.version += " (Version up to date)"
-                    color = "green"
-            gui.create_logitem(v.version, color , True)
+        # the version check runs in the background, the result is added to the top of the log when it arrives
+        checkversion.check_versions(lambda master, dev: gui.post(report_version, master, dev))
 
         gui.configinfo()
         gui.create_emptyline()
@@ -139,6 +260,22 @@ if __name__ == "__main__":
         gui.create_logitem("More info on: https://github.com/tomvandeneede/p2pp", "blue")
         gui.close_button_enable()
     else:
+        args = vars(arguments.parse_args())
+        if args['batch']:
+            summary = batch_main(args)
+            sys.exit(1 if summary['errors'] else 0)
+        if args['watch']:
+            watch_main(args)
+            sys.exit(0)
+        if args['serve'] is not None:
+            serve_main(args)
+            sys.exit(0)
+
+        # select the front end before anything is logged, --nogui never loads tkinter
+        gui.select_backend(args['nogui'])
         gui.create_logitem("Python Version Information: "+platform.python_version() ,
                            "blue")
-        main(vars(arguments.parse_args()))
+        main(args)
+        if args['nogui']:
+            # no window keeps the program running until a version check (CHECKVERSION) reports
+            checkversion.wait()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+__author__ = 'Tom Van den Eede'
+__copyright__ = 'Copyright 2018-2020, Palette2 Splicer Post Processing Project'
+__credits__ = ['Tom Van den Eede',
+               'Tim Brookman'
+               ]
+__license__ = 'GPLv3'
+__maintainer__ = 'Tom Van den Eede'
+__email__ = 'P2PP@pandora.be'
+
+# Generates PrusaSlicer style multi colour GCode to benchmark P2PP with: wipe tower brim, toolchange blocks
+# (CP TOOLCHANGE START/UNLOAD/WIPE/END), empty grids on sparse layers, ;LAYER markers, ;P2PP settings for the
+# processing mode and the slicer configuration footer.  The same arguments always give the same file.
+#
+#   python benchmarks/gencorpus.py <output file> [--mode tower] [--layers 30] [--toolchanges 2] [--filaments 4]
+#                                                [--sparse 0.3] [--size MB] [--seed 1]
+#
+# With --size the file gets as many layers as needed to reach the size, --layers is then ignored.
+
+import argparse
+import random
+
+# ;P2PP settings per processing mode
+MODES = {
+    'tower': [],
+    'delta': [';P2PP PURGETOWERDELTA=3'],
+    'fullpurge': [';P2PP FULLPURGEREDUCTION'],
+    'sidewipe': [';P2PP SIDEWIPELOC=X253.9', ';P2PP SIDEWIPEMINY=45', ';P2PP SIDEWIPEMAXY=195'],
+    'bigbrain': [';P2PP BIGBRAIN3D_ENABLE', ';P2PP BIGBRAIN3D_PRIME_BLOBS=2'],
+    'accessory': [';P2PP ACCESSORYMODE_MAF'],
+    'm4c': [],
+    'absolute': [';P2PP ABSOLUTEEXTRUDER'],
+    'fwretract': [';P2PP PURGETOWERDELTA=3'],
+}
+
+COLORS = ["#FF0000", "#00FF00", "#0000FF", "#FFFF00", "#FF00FF", "#00FFFF", "#FFFFFF", "#000000"]
+
+RETRACT = "G1 E-.8 F2100\n"
+UNRETRACT = "G1 E.8 F2100\n"
+
+
+class CorpusWriter(object):
+    # counts what is written, firmware retraction replaces the retract moves by G10/G11
+
+    def __init__(self, out, firmware_retraction=False):
+        self.out = out
+        self.firmware_retraction = firmware_retraction
+        self.size = 0
+        self.lines = 0
+
+    def write(self, text):
+        if self.firmware_retraction:
+            text = text.replace(RETRACT, "G10\n").replace(UNRETRACT, "G11\n")
+        self.out.write(text)
+        self.size += len(text)
+        self.lines += text.count("\n")
+
+
+def filament_colors(filaments):
+    colors = list(COLORS)
+    rnd = random.Random(filaments)
+    while len(colors) < filaments:
+        colors.append("#{:06X}".format(rnd.randrange(0x1000000)))
+    return colors[:filaments]
+
+
+def write_header(w, mode):
+    w("; generated by PrusaSlicer 2.2.0+linux-x64 on 2020-05-01 at 10:00:00 UTC\n\n")
+    w(";\n\n; external perimeters extrusion width = 0.45mm\n\n")
+    w("M107\n;TYPE:Custom\n")
+    w(";P2PP PRINTERPROFILE=0123456789abcdef\n;P2PP SPLICEOFFSET=30\n;P2PP MATERIAL_DEFAULT_0_0_0\n")
+    for setting in MODES[mode]:
+        w(setting + "\n")
+    w("M104 S215 ; set extruder temp\nM140 S60 ; set bed temp\nG28 W ; home all without mesh bed level\n")
+    w("G21 ; set units to millimeters\nG90 ; use absolute coordinates\nM83 ; use relative distances for extrusion\n")
+    w("G1 Z0.2 F720\nG1 Y-3.0 F1000.0 ; go outside print area\nG92 E0.0\nG1 X60.0 E9.0 F1000.0 ; intro line\n")
+    w("G1 X100.0 E12.5 F1000.0 ; intro line\nG92 E0.0\nM221 S95\nM900 K0\n")
+    w("G21 ; set units to millimeters\nG90 ; use absolute coordinates\nM83 ; use relative distances for extrusion\n")
+    w("T0\n")
+
+
+def write_brim(w, towerx, towery):
+    w("; CP WIPE TOWER FIRST LAYER BRIM START\n")
+    w("G1 X{:.3f} Y{:.3f} F7200\n".format(towerx, towery))
+    for i in range(8):
+        w("G1 X{:.3f} Y{:.3f} E{:.4f} F1200\n".format(towerx + (i % 2) * 60, towery + (i // 2) * 0.5, 2.1))
+    w("; CP WIPE TOWER FIRST LAYER BRIM END\n")
+    w(RETRACT + "G1 X{:.3f} Y{:.3f} F7200\n".format(90, 90) + UNRETRACT)
+
+
+def write_island(w, rnd, moves):
+    w(";TYPE:Perimeter\n;WIDTH:0.45\nG1 F1200\n")
+    x, y = rnd.uniform(40, 150), rnd.uniform(40, 120)
+    for i in range(moves):
+        x += rnd.uniform(-5, 5)
+        y += rnd.uniform(-5, 5)
+        if i % 17 == 16:
+            w(RETRACT + "G1 X{:.3f} Y{:.3f} F7200\n".format(x, y) + UNRETRACT)
+        elif i % 23 == 5:
+            w("M106 S{}\n;TYPE:Solid infill\n".format(rnd.randint(100, 255)))
+        else:
+            w("G1 X{:.3f} Y{:.3f} E{:.5f}\n".format(x, y, rnd.uniform(0.01, 0.9)))
+
+
+def write_toolchange(w, rnd, number, tool, z, towerx, towery):
+    w(RETRACT + "G1 X{:.3f} Y{:.3f} F7200\n".format(towerx + 5, towery + 2) + UNRETRACT)
+    w("; CP TOOLCHANGE START\n; toolchange #{}\n; material : PLA -> PLA\n".format(number))
+    w(";--------------------\nM220 B\nM220 S100\n")
+    w("; CP TOOLCHANGE UNLOAD\n")
+    for i in range(6):
+        w("G1 X{:.3f} Y{:.3f} E{:.4f} F2000\n".format(towerx + 5 + 50 * (i % 2), towery + 2 + i * 0.5, 1.5))
+    w("G4 S0\nM900 K0\nG1 Z{:.3f} F10800\n".format(z))
+    w("; CP TOOLCHANGE WIPE\nM220 R\nG1 F10800\nG4 S0\n")
+    w("T{}\nM900 K30\n".format(tool))
+    for i in range(14):
+        w("G1 X{:.3f} Y{:.3f} E{:.4f} F{}\n".format(towerx + 5 + 50 * (i % 2), towery + 5 + i * 0.5, 2.2, 2400 + i * 100))
+    w(RETRACT + "; CP TOOLCHANGE END\n;------------------\n\n\n")
+    w("G1 X{:.3f} Y{:.3f} F7200\n".format(rnd.uniform(40, 150), rnd.uniform(40, 120)) + UNRETRACT)
+
+
+def write_empty_grid(w, rnd, layer, towerx, towery):
+    w(RETRACT + "G1 X{:.3f} Y{:.3f} F7200\n".format(towerx + 5, towery + 2) + UNRETRACT)
+    w("; CP EMPTY GRID START\n; layer {}\n".format(layer))
+    for i in range(6):
+        w("G1 X{:.3f} Y{:.3f} E{:.4f} F2400\n".format(towerx + 5 + 50 * (i % 2), towery + 2 + i * 3, 1.0))
+    w(RETRACT + "; CP EMPTY GRID END\n;------------------\n\n\n")
+    w("G1 X{:.3f} Y{:.3f} F7200\n".format(rnd.uniform(40, 150), rnd.uniform(40, 120)) + UNRETRACT)
+
+
+def write_footer(w, mode, filaments, towerx, towery):
+    w("G1 E-.8 F2100\nM107\nM104 S0\nM140 S0\nG1 X0 Y200 F3000\nM84\n")
+    w("; filament used [mm] = 1234.5, 234.5, 345.6, 45.6\n; filament used [cm3] = 3.0, 0.5, 0.8, 0.1\n")
+    w("; total filament used [g] = 12.3\n; estimated printing time (normal mode) = 1h 2m 3s\n\n")
+    config = [
+        ("extruder_colour", ";".join(['""'] * filaments)),
+        ("extrusion_width", "0.45"),
+        ("filament_colour", ";".join(filament_colors(filaments))),
+        ("filament_diameter", ",".join(["1.75"] * filaments)),
+        ("filament_settings_id", ";".join('"Fil {}"'.format(i) for i in range(filaments))),
+        ("filament_type", ";".join(["PLA"] * filaments)),
+        ("first_layer_height", "0.2"),
+        ("gcode_flavor", "marlin"),
+        ("infill_speed", "80"),
+        ("layer_height", "0.2"),
+        ("min_skirt_length", "4"),
+        ("retract_length", ",".join(["0.8"] * filaments)),
+        ("retract_lift", ",".join(["0.6"] * filaments)),
+        ("skirts", "0"),
+        ("support_material", "0"),
+        ("support_material_synchronize_layers", "0"),
+        ("use_firmware_retraction", "1" if mode == 'fwretract' else "0"),
+        ("use_relative_e_distances", "1"),
+        ("wipe_tower_no_sparse_layers", "0"),
+        ("wipe_tower_width", "60"),
+        ("wipe_tower_x", "{}".format(towerx)),
+        ("wipe_tower_y", "{}".format(towery)),
+        ("wiping_volumes_matrix", ",".join("0" if i % (filaments + 1) == 0 else "140"
+                                           for i in range(filaments * filaments))),
+    ]
+    for key, value in config:
+        w("; {} = {}\n".format(key, value))
+
+
+def generate(out, mode="tower", layers=30, toolchanges=2, filaments=4, sparse=0.3, size=None, seed=1, moves=60):
+    # writes the file to out, returns (lines, bytes)
+    if mode == 'm4c':
+        filaments = max(filaments, 6)
+
+    writer = CorpusWriter(out, mode == 'fwretract')
+    w = writer.write
+    rnd = random.Random(seed)
+
+    if mode in ('sidewipe', 'bigbrain'):
+        towerx, towery = -80.0, 140.0
+    else:
+        towerx, towery = 170.0, 140.0
+
+    write_header(w, mode)
+
+    tool = 0
+    number = 0
+    z = 0.2
+    layer = 0
+    while (size is None and layer < layers) or (size is not None and writer.size < size):
+        w(";BEFORE_LAYER_CHANGE\nG92 E0.0\n;{:.1f}\n\n".format(z))
+        w(RETRACT + "G1 Z{:.3f} F10800.000\n;AFTER_LAYER_CHANGE\n;LAYER {}\n".format(z + 0.6, layer))
+        w(";LAYERHEIGHT {:.2f}\n".format(z))
+        w("G1 X{:.3f} Y{:.3f}\nG1 Z{:.3f}\n".format(rnd.uniform(60, 120), rnd.uniform(60, 120), z) + UNRETRACT)
+        if layer == 0:
+            write_brim(w, towerx, towery)
+
+        changes = toolchanges if layer == 0 or rnd.random() >= sparse else 0
+        for island in range(changes + 1):
+            write_island(w, rnd, moves)
+            if island < changes:
+                if number < 3:
+                    # the first toolchanges load the first four filaments, like a slicer would
+                    new_tool = number + 1
+                else:
+                    new_tool = tool
+                    while new_tool == tool:
+                        new_tool = rnd.randrange(filaments)
+                number += 1
+                tool = new_tool
+                write_toolchange(w, rnd, number, tool, z, towerx, towery)
+
+        if changes == 0:
+            write_empty_grid(w, rnd, layer, towerx, towery)
+
+        z += 0.2
+        layer += 1
+
+    write_footer(w, mode, filaments, towerx, towery)
+    return writer.lines, writer.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generates multi colour GCode to benchmark P2PP with.')
+    parser.add_argument('output_file')
+    parser.add_argument('--mode', choices=sorted(MODES), default='tower',
+                        help='Processing mode, adds the ;P2PP settings it needs')
+    parser.add_argument('--layers', type=int, default=30)
+    parser.add_argument('--toolchanges', type=int, default=2, help='Toolchanges per layer')
+    parser.add_argument('--filaments', type=int, default=4,
+                        help='Number of filaments, more than 4 needs swaps (at least 6 for --mode m4c)')
+    parser.add_argument('--sparse', type=float, default=0.3,
+                        help='Fraction of the layers without toolchange (empty grid)')
+    parser.add_argument('--size', type=float, help='Size of the file in MB, overrides --layers')
+    parser.add_argument('--moves', type=int, default=60, help='Moves per island between two toolchanges')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.filaments < 2 or args.filaments > 20:
+        parser.error("--filaments must be between 2 and 20")
+
+    size = None
+    if args.size:
+        size = int(args.size * 1024 * 1024)
+
+    with open(args.output_file, "w") as out:
+        lines, written = generate(out, args.mode, args.layers, args.toolchanges, args.filaments, args.sparse, size,
+                                  args.seed, args.moves)
+    print("{}: {} lines, {:.1f} MB".format(args.output_file, lines, written / 1024.0 / 1024.0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+__author__ = 'Tom Van den Eede'
+__copyright__ = 'Copyright 2018-2020, Palette2 Splicer Post Processing Project'
+__credits__ = ['Tom Van den Eede',
+               'Tim Brookman'
+               ]
+__license__ = 'GPLv3'
+__maintainer__ = 'Tom Van den Eede'
+__email__ = 'P2PP@pandora.be'
+
+# Benchmarks every processing mode on a generated corpus (see gencorpus.py) and records wall time, lines per
+# second, time per processing stage, peak RSS and output size as JSON.  Every run is done in a new python
+# process, so the memory use of one mode does not hide in the peak of another.
+#
+#   python benchmarks/matrix.py [--modes tower,m4c] [--layers 200 | --size MB] [--repeat 3]
+#                               [--output results.json] [--baseline baseline.json] [--threshold 10]
+#
+# With --baseline the run fails (exit code 1) when a mode is more than --threshold percent slower, or uses more
+# than --threshold percent more memory, than in the baseline.  A results file can be used as baseline.
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+
+try:
+    import resource
+except ImportError:
+    # windows, no peak RSS
+    resource = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import gencorpus
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # bytes on macOS, kilobytes elsewhere
+        peak //= 1024
+    return peak
+
+
+def run_job(input_file, output_file):
+    # runs in the child process, prints the result as JSON
+    import p2pp.batch as batch
+    result = batch.process_file(input_file, output_file)
+    output_size = 0
+    for filename in (output_file, os.path.splitext(output_file)[0] + ".maf", os.path.splitext(output_file)[0] + ".msf"):
+        if os.path.exists(filename):
+            output_size += os.path.getsize(filename)
+    print(json.dumps({"status": result["status"],
+                      "error": result["error"],
+                      "time": result["time"],
+                      "stages": result["stages"],
+                      "peak_rss_kb": peak_rss_kb(),
+                      "output_size": output_size}))
+
+
+def run_mode(mode, input_file, work_dir, repeat):
+    output_file = os.path.join(work_dir, "out_" + mode + ".gcode")
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--job", input_file, output_file])
+        runs.append(json.loads(output.decode("utf-8").strip().splitlines()[-1]))
+
+    with open(input_file) as opf:
+        lines = sum(1 for _ in opf)
+
+    fastest = min(runs, key=lambda run: run["time"])
+    best = fastest["time"]
+    peaks = [run["peak_rss_kb"] for run in runs if run["peak_rss_kb"] is not None]
+    return {"status": runs[-1]["status"],
+            "error": runs[-1]["error"],
+            "lines": lines,
+            "input_size": os.path.getsize(input_file),
+            "time": best,
+            "lines_per_second": round(lines / max(best, 1e-6)),
+            "stages": fastest["stages"],
+            "peak_rss_kb": max(peaks) if peaks else None,
+            "output_size": runs[-1]["output_size"]}
+
+
+def compare(results, baseline, threshold):
+    # returns the list of regressions, one text per failing measurement
+    regressions = []
+    for mode, result in sorted(results["modes"].items()):
+        base = baseline.get("modes", {}).get(mode)
+        if base is None:
+            continue
+        for key in ("time", "peak_rss_kb"):
+            if not base.get(key) or result.get(key) is None:
+                continue
+            change = (float(result[key]) / base[key] - 1.0) * 100.0
+            if change > threshold:
+                regressions.append("{}: {} {} -> {} (+{:.1f}%)".format(mode, key, base[key], result[key], change))
+    return regressions
+
+
+def print_results(results):
+    print("{:<10} {:>8} {:>9} {:>10} {:>12} {:>10} {:>10}".format("Mode", "Status", "Lines", "Time", "Lines/s",
+                                                                 "Peak RSS", "Output"))
+    for mode, result in sorted(results["modes"].items()):
+        peak = "-"
+        if result["peak_rss_kb"] is not None:
+            peak = "{:.1f}MB".format(result["peak_rss_kb"] / 1024.0)
+        print("{:<10} {:>8} {:>9} {:>9.3f}s {:>12} {:>10} {:>8.1f}MB".format(mode, result["status"], result["lines"],
+                                                                          result["time"], result["lines_per_second"],
+                                                                          peak,
+                                                                          result["output_size"] / 1024.0 / 1024.0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks every P2PP processing mode.')
+    parser.add_argument('--job', nargs=2, metavar=('INPUT', 'OUTPUT'), help=argparse.SUPPRESS)
+    parser.add_argument('--modes', default=",".join(sorted(gencorpus.MODES)),
+                        help='Comma separated list of modes, default all')
+    parser.add_argument('--layers', type=int, default=200, help='Layers in the generated files')
+    parser.add_argument('--size', type=float, help='Size of the generated files in MB, overrides --layers')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per mode, the fastest time is kept')
+    parser.add_argument('--work-dir', help='Keep the generated and processed files in this directory')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Results file to compare with')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='Allowed slow down or memory growth against the baseline in percent')
+    args = parser.parse_args()
+
+    if args.job:
+        run_job(*args.job)
+        return 0
+
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    for mode in modes:
+        if mode not in gencorpus.MODES:
+            parser.error("unknown mode {}, use one of {}".format(mode, ", ".join(sorted(gencorpus.MODES))))
+
+    size = None
+    if args.size:
+        size = int(args.size * 1024 * 1024)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="p2pp-bench-")
+    if not os.path.isdir(work_dir):
+        os.makedirs(work_dir)
+
+    results = {"python": platform.python_version(),
+               "platform": platform.platform(),
+               "corpus": {"layers": args.layers, "size": args.size},
+               "repeat": args.repeat,
+               "modes": {}}
+    try:
+        for mode in modes:
+            input_file = os.path.join(work_dir, mode + ".gcode")
+            with open(input_file, "w") as out:
+                gencorpus.generate(out, mode, layers=args.layers, size=size)
+            results["modes"][mode] = run_mode(mode, input_file, work_dir, args.repeat)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w") as opf:
+            json.dump(results, opf, indent=2, sort_keys=True)
+
+    failed = [mode for mode, result in results["modes"].items() if result["status"] == "error"]
+    for mode in failed:
+        print("{}: processing failed - {}".format(mode, results["modes"][mode]["error"]))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as opf:
+            regressions = compare(results, json.load(opf), args.threshold)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        if not regressions:
+            print("No regressions against {} (threshold {:.0f}%)".format(args.baseline, args.threshold))
+
+    return 1 if failed or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+__author__ = 'Tom Van den Eede'
+__copyright__ = 'Copyright 2018-2020, Palette2 Splicer Post Processing Project'
+__credits__ = ['Tom Van den Eede',
+               'Tim Brookman'
+               ]
+__license__ = 'GPLv3'
+__maintainer__ = 'Tom Van den Eede'
+__email__ = 'P2PP@pandora.be'
+
+# Micro benchmark for the GCode line tokenizer, compares GCodeCommand with the split based
+# version it replaced.
+#
+#   python benchmarks/tokenizer.py <gcode file> [repeat]
+#
+# "parse" only creates the command objects, "parse+decode" also decodes the parameters by reading E.
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import p2pp.gcode as gcode
+
+
+class LegacyGCodeCommand:
+    # GCodeCommand as it was before the compiled tokenizer, parameters are decoded in the constructor
+    Command = None
+    fullcommand = None
+    Command_value = None
+    Parameters = {}
+    Comment = None
+    X = None
+    Y = None
+    Z = None
+    E = None
+
+    def __init__(self, gcode_line):
+        self.Command = None
+        self.fullcommand = None
+        self.Command_value = None
+        self.Parameters = {}
+        self.Comment = None
+        gcode_line = gcode_line.strip()
+        pos = gcode_line.find(";")
+
+        if pos != -1:
+            self.Comment = gcode_line[pos + 1:]
+            gcode_line = (gcode_line.split(';')[0]).strip()
+
+        fields = gcode_line.split(' ')
+
+        if len(fields[0]) > 0:
+            command = fields[0]
+            self.Command = command[0]
+            self.Command_value = command[1:]
+            self.fullcommand = fields[0]
+            fields = fields[1:]
+
+            while len(fields) > 0:
+                param = fields[0].strip()
+                if len(param) > 0:
+                    p = param[0]
+                    val = param[1:]
+
+                    try:
+                        if "." in val:
+                            val = float(val)
+                        else:
+                            val = int(val)
+                    except ValueError:
+                        pass
+
+                    self.Parameters[p] = val
+
+                fields = fields[1:]
+
+            self.X = self.get_parameter("X", None)
+            self.Y = self.get_parameter("Y", None)
+            self.Z = self.get_parameter("Z", None)
+            self.E = self.get_parameter("E", None)
+
+    def get_parameter(self, m, default):
+        if m in self.Parameters:
+            return self.Parameters[m]
+        return default
+
+
+def run_legacy(lines):
+    for line in lines:
+        LegacyGCodeCommand(line)
+
+
+def run_parse(lines):
+    for line in lines:
+        gcode.GCodeCommand(line)
+
+
+def run_parse_decode(lines):
+    for line in lines:
+        gcode.GCodeCommand(line).E
+
+
+def measure(name, function, lines, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        function(lines)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    rate = len(lines) / max(best, 1e-9)
+    print("{:<24} {:8.3f}s {:12.0f} lines/s".format(name, best, rate))
+    return rate
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("usage: tokenizer.py <gcode file> [repeat]")
+        sys.exit(1)
+
+    repeat = 3
+    if len(sys.argv) > 2:
+        repeat = int(sys.argv[2])
+
+    with open(sys.argv[1]) as opf:
+        lines = [line.strip() for line in opf]
+
+    print("{} lines, best of {}".format(len(lines), repeat))
+    legacy = measure("legacy parse (eager)", run_legacy, lines, repeat)
+    measure("parse", run_parse, lines, repeat)
+    current = measure("parse+decode", run_parse_decode, lines, repeat)
+    print("speedup parse+decode over legacy: {:.2f}x".format(current / legacy))
+
+
+if __name__ == "__main__":
+    main()
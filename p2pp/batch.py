@@ -0,0 +1,156 @@
+__author__ = 'Tom Van den Eede'
+__copyright__ = 'Copyright 2018-2020, Palette2 Splicer Post Processing Project'
+__credits__ = ['Tom Van den Eede',
+               'Tim Brookman'
+               ]
+__license__ = 'GPLv3'
+__maintainer__ = 'Tom Van den Eede'
+__email__ = 'P2PP@pandora.be'
+
+# Batch processing: many files in one invocation, spread over a pool of worker processes.  Every job runs with
+# its own ProcessingContext and returns a small summary of the result.
+
+import glob
+import multiprocessing
+import os
+
+try:
+    from time import monotonic
+except ImportError:
+    # python version 2.x
+    from time import time as monotonic
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    # python version 2.x without the futures backport, jobs are processed one after the other
+    ProcessPoolExecutor = None
+
+import p2pp.consolegui as consolegui
+import p2pp.gui as gui
+import p2pp.mcf as mcf
+import version
+from p2pp.context import ProcessingContext
+
+
+def new_context():
+    ctx = ProcessingContext()
+    ctx.version = version.Version
+    ctx.gui = False
+    return ctx
+
+
+def expand_inputs(patterns):
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            # keep it, the job reports the missing file
+            matches = [pattern]
+        for filename in matches:
+            if filename not in files:
+                files.append(filename)
+    return files
+
+
+def output_name(input_file, output_dir):
+    if not output_dir:
+        return None
+    return os.path.join(output_dir, os.path.basename(input_file))
+
+
+def process_file(input_file, output_file=None, printer_profile="", splice_offset=40.0, log_file=None):
+    ctx = new_context()
+    gui.select_backend(True)
+    consolegui.interactive = False
+
+    result = {"input": input_file,
+              "output": output_file or input_file,
+              "status": "ok",
+              "error": None}
+
+    start = monotonic()
+    log = None
+    try:
+        # the log of a job goes to its own file, or nowhere
+        log = open(log_file or os.devnull, "w")
+        consolegui.log_file = log
+        mcf.generate(ctx, input_file, output_file, printer_profile, splice_offset, False)
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = "{}: {}".format(type(e).__name__, e)
+        consolegui.create_logitem("ERROR: " + result["error"])
+    finally:
+        consolegui.log_file = None
+        if log is not None:
+            log.close()
+
+    if not ctx.output_written:
+        result["status"] = "error"
+        result["error"] = result["error"] or "no output generated"
+    elif result["status"] == "ok" and ctx.process_warnings:
+        result["status"] = "warnings"
+
+    result["time"] = round(monotonic() - start, 3)
+    result["processtime"] = round(ctx.processtime, 3)
+    result["stages"] = {}
+    if ctx.timer is not None:
+        result["stages"] = dict((name, round(seconds, 3)) for name, seconds in ctx.timer.stages.items())
+    result["splices"] = len(ctx.splice_extruder_position)
+    result["pings"] = len(ctx.ping_extruder_position)
+    result["warnings"] = [warning[1:].strip() for warning in ctx.process_warnings]
+    result["filament_used"] = round(ctx.total_material_extruded, 2)
+    return result
+
+
+def run_batch(patterns, workers=0, output_dir=None, printer_profile="", splice_offset=40.0, log_dir=None):
+    files = expand_inputs(patterns)
+    if workers <= 0:
+        workers = multiprocessing.cpu_count()
+    workers = max(1, min(workers, len(files)))
+
+    for directory in (output_dir, log_dir):
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    jobs = []
+    for input_file in files:
+        log_file = None
+        if log_dir:
+            log_file = os.path.join(log_dir, os.path.basename(input_file) + ".log")
+        jobs.append((input_file, output_name(input_file, output_dir), printer_profile, splice_offset, log_file))
+
+    start = monotonic()
+    if workers == 1 or ProcessPoolExecutor is None:
+        workers = 1
+        results = [process_file(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(process_file, *job) for job in jobs]
+            results = [future.result() for future in futures]
+
+    return {"workers": workers,
+            "files": len(results),
+            "errors": len([result for result in results if result["status"] == "error"]),
+            "time": round(monotonic() - start, 3),
+            "jobs": results}
+
+
+def print_header():
+    print("{:<40} {:>8} {:>7} {:>6} {:>8} {:>8}".format("File", "Status", "Splices", "Pings", "Warnings", "Time"))
+
+
+def print_job(job):
+    print("{:<40} {:>8} {:>7} {:>6} {:>8} {:>7.2f}s".format(os.path.basename(job["input"])[-40:], job["status"],
+                                                          job["splices"], job["pings"], len(job["warnings"]),
+                                                          job["time"]))
+    if job["error"]:
+        print("    " + job["error"])
+
+
+def print_summary(summary):
+    print_header()
+    for job in summary["jobs"]:
+        print_job(job)
+    print("{} files processed in {:.2f}s using {} worker(s), {} failed".format(summary["files"], summary["time"],
+                                                                             summary["workers"], summary["errors"]))
@@ -8,7 +8,11 @@ __maintainer__ = 'Tom Van den Eede'
 __email__ = 'P2PP@pandora.be'
 
 
+import json
+import os
 import platform
+import threading
+import time
 
 
 version = "https://github.com/tomvandeneede/p2pp/raw/{}/version.py"
@@ -16,14 +20,44 @@ version = "https://github.com/tomvandeneede/p2pp/raw/{}/version.py"
 MASTER = version.format('master')
 DEV = version.format('dev')
 
+# the check runs in the background with a short timeout, answers are kept in a small cache in the home directory
+# so repeated runs (and machines without internet access) do not wait for the network every time
+TIMEOUT = 3
+CACHE_FILE = os.path.join(os.path.expanduser("~"), ".p2pp_version_cache.json")
+CACHE_TTL = 24 * 3600
+CACHE_TTL_FAILED = 3600
+
 _p = platform.python_version().strip()
 python_version = _p[0]
 
-def get_version( _url_ ):
+_cache_lock = threading.Lock()
+checkers = []
+
+
+def read_cache():
+    try:
+        with open(CACHE_FILE) as cachefile:
+            cache = json.load(cachefile)
+        if isinstance(cache, dict):
+            return cache
+    except (IOError, OSError, ValueError):
+        pass
+    return {}
+
+
+def write_cache(cache):
+    try:
+        with open(CACHE_FILE, "w") as cachefile:
+            json.dump(cache, cachefile)
+    except (IOError, OSError):
+        pass
+
+
+def download_version( _url_ ):
     try:
         if python_version == "2":
-            import urllib
-            response = urllib.urlopen(_url_)
+            import urllib2
+            response = urllib2.urlopen(_url_, timeout=TIMEOUT)
             lines = "".join(response).splitlines()
 
         if python_version == "3":
@@ -31,8 +65,7 @@ def get_version( _url_ ):
             import ssl
             https_sslv3_handler = urllib.request.HTTPSHandler(context=ssl.SSLContext())
             opener = urllib.request.build_opener(https_sslv3_handler)
-            urllib.request.install_opener(opener)
-            response = opener.open(_url_).read().decode('utf-8')
+            response = opener.open(_url_, timeout=TIMEOUT).read().decode('utf-8')
             lines = "".join(response).splitlines()
 
          # get version information
@@ -56,4 +89,40 @@ def get_version( _url_ ):
         return None
 
 
+def get_version( _url_ ):
+    now = time.time()
+    with _cache_lock:
+        entry = read_cache().get(_url_)
+    if entry:
+        ttl = CACHE_TTL if entry.get("version") else CACHE_TTL_FAILED
+        if 0 <= now - entry.get("time", 0) < ttl:
+            return entry.get("version")
+
+    latest = download_version(_url_)
+
+    with _cache_lock:
+        cache = read_cache()
+        cache[_url_] = {"version": latest, "time": now}
+        write_cache(cache)
+    return latest
+
+
+def check_versions(callback):
+    # looks up the master and dev versions on a background thread and calls callback(master, dev) from that thread,
+    # the check never blocks the caller
+    def check():
+        callback(get_version(MASTER), get_version(DEV))
+
+    checker = threading.Thread(target=check, name="p2pp-versioncheck")
+    checker.daemon = True
+    checker.start()
+    checkers.append(checker)
+    return checker
+
 
+def wait(timeout=2 * TIMEOUT):
+    # gives the running checks the time to report before the program ends, a check downloads two files.  A check
+    # that did not finish in time is dropped, answers in the cache come back at once.
+    end = time.time() + timeout
+    for checker in checkers:
+        checker.join(max(0.0, end - time.time()))
@@ -0,0 +1,106 @@
+__author__ = 'Tom Van den Eede'
+__copyright__ = 'Copyright 2018-2020, Palette2 Splicer Post Processing Project'
+__credits__ = ['Tom Van den Eede',
+               'Tim Brookman'
+               ]
+__license__ = 'GPLv3'
+__maintainer__ = 'Tom Van den Eede'
+__email__ = 'P2PP@pandora.be'
+
+# Console front end for headless use (--nogui), implements the same functions as tkgui without importing tkinter
+
+import sys
+
+import p2pp.colornames as colornames
+
+try:
+    # python version 2.x
+    read_input = raw_input
+except NameError:
+    # python version 3.x
+    read_input = input
+
+# batch jobs write their log to a file and never wait for the user
+log_file = None
+interactive = True
+
+
+def write(text):
+    if log_file is None:
+        # one write per line, a background thread (version check) may write at the same time
+        sys.stdout.write(text + "\n")
+    else:
+        log_file.write(text + "\n")
+
+
+def progress_string(pct, warnings=0):
+    if pct == 100:
+        if warnings == 0:
+            completed("  COMPLETED OK")
+        else:
+            completed("  COMPLETED WITH WARNINGS")
+
+
+def completed(text, color=None):
+    write(text)
+    if log_file is None:
+        sys.stdout.flush()
+
+
+def create_logitem(text, color="black", force_update=True, position=None):
+    write("  " + text.strip())
+
+
+def create_colordefinition(reporttype, input, filament_type, color_code, filamentused, filament_id=""):
+    if reporttype == 0:
+        text = "  \tInput  {} {:-8.2f}mm - {}".format(input, filamentused, filament_type)
+    else:
+        text = "  \tFilament  {}  - {}".format(input, filament_type)
+
+    write("{}  \t{:15} {} ".format(text, colornames.find_nearest_colour(color_code), filament_id))
+
+
+def create_emptyline():
+    create_logitem('')
+
+
+def close_button_enable(consolewait=False):
+    # only block when asked for (-w 1), a headless run should never wait for a key press
+    if consolewait and interactive:
+        read_input("Press Enter to continue...")
+
+
+def set_printer_id(text):
+    pass
+
+
+def setfilename(text):
+    pass
+
+
+def user_error(header, body_text):
+    write("{}: {}".format(header, body_text))
+
+
+def ask_yes_no(title, message):
+    if not interactive:
+        write("{} - answered no".format(message))
+        return False
+    answer = read_input(message + " ([Y]es/[N]o): ").lower().strip()
+    while not (answer == "y" or answer == "yes" or answer == "n" or answer == "no"):
+        print("Input yes or no")
+        answer = read_input(message + " ([Y]es/[N]o): ").lower().strip()
+    return answer[0] == "y"
+
+
+def configinfo():
+    pass
+
+
+def post(function, *args):
+    # the console can be written from any thread
+    function(*args)
+
+
+def run_job(function, ctx, *args):
+    function(ctx, *args)
@@ -0,0 +1,30 @@
+__author__ = 'Tom Van den Eede'
+__copyright__ = 'Copyright 2018-2020, Palette2 Splicer Post Processing Project'
+__credits__ = ['Tom Van den Eede',
+               'Tim Brookman'
+               ]
+__license__ = 'GPLv3'
+__maintainer__ = 'Tom Van den Eede'
+__email__ = 'P2PP@pandora.be'
+
+import copy
+import types
+
+import p2pp.gui as gui
+import p2pp.variables as v
+
+
+class ProcessingContext(object):
+    # All state of one processing job.  The defaults are the values in p2pp.variables, which keeps the application
+    # level settings (version, gui, consolewait, ...).  Every job gets its own copy, nothing is shared between jobs,
+    # so jobs can run one after the other or in parallel threads.
+
+    def __init__(self):
+        for name, value in vars(v).items():
+            if name.startswith("__") or isinstance(value, types.ModuleType):
+                continue
+            setattr(self, name, copy.deepcopy(value))
+
+    def log_warning(self, text):
+        self.process_warnings.append(";" + text)
+        gui.create_logitem(text, "red")
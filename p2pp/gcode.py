@@ -15,94 +15,227 @@ EXTRUDER = "E"
 RELATIVE = True
 ABSOLUTE = False
 
+import re
+
 import p2pp.gui as gui
-import p2pp.variables as v
-
-
-class GCodeCommand:
-    Command = None
-    fullcommand = None
-    Command_value = None
-    Parameters = {}
-    Class = 0
-    Comment = None
-    Layer = None
-    Tool = None
-    X = None
-    Y = None
-    Z = None
-    E = None
 
-    def __init__(self, gcode_line):
-        self.Command = None
-        self.fullcommand = None
-        self.Command_value = None
-        self.Parameters = {}
-        self.Comment = None
-        self.Layer = v.parsedlayer
-        gcode_line = gcode_line.strip()
-        pos = gcode_line.find(";")
 
-        if pos != -1:
-            self.Comment = gcode_line[pos + 1:]
-            gcode_line = (gcode_line.split(';')[0]).strip()
+MOVEMENT_COMMANDS = frozenset(["G0", "G1", "G2", "G3", "G5", "G10", "G11"])
+
+# bit flags for the parameters that are kept in fixed fields
+_FIXED_PARAMETERS = {"X": 1, "Y": 2, "Z": 4, "E": 8, "F": 16}
+
 
-        fields = gcode_line.split(' ')
+# command, parameters and comment of a (stripped) GCode line in one match
+_LINE = re.compile(r'([^\s;]+)\s*([^;]*)(?:;(.*))?')
 
-        if len(fields[0]) > 0:
-            command = fields[0]
-            self.Command = command[0]
-            self.Command_value = command[1:]
-            self.fullcommand = fields[0]
-            fields = fields[1:]
 
-            while len(fields) > 0:
-                param = fields[0].strip()
-                if len(param) > 0:
-                    p = param[0]
-                    val = param[1:]
+class GCodeCommand(object):
+    # GCode files consist of millions of lines, mostly comments.  The line is split with a single match of _LINE
+    # when it is read, the parameters are decoded on first use.  X/Y/Z/E/F are kept in fixed fields, any other
+    # parameter goes into a dictionary that is only created when needed.
+    #
+    # Assigning X, Y, Z or E directly only changes the attribute, the parameter is not added to the output
+    # (e.g. g.E = 0 for commands without extrusion).  Use update_parameter to change the command itself.
+    #
+    # The original text is kept, a command is only formatted again when update_parameter, remove_parameter,
+    # move_to_comment or add_comment marked it dirty.  Unchanged lines are written exactly as the slicer did.
 
-                    try:
-                        if "." in val:
-                            val = float(val)
-                        else:
-                            val = int(val)
-                    except ValueError:
-                        pass
+    __slots__ = ("Command", "fullcommand", "Command_value", "Comment", "Class", "Layer", "Tool",
+                 "_text", "_dirty", "_raw", "_present", "_X", "_Y", "_Z", "_E", "_F", "_other")
+
+    def __init__(self, gcode_line):
+        self.Command = None
+        self.fullcommand = None
+        self.Command_value = None
+        self.Comment = None
+        self.Class = 0
+        self.Layer = -1
+        self.Tool = None
+        self._raw = None
+        self._present = 0
+        self._X = self._Y = self._Z = self._E = self._F = None
+        self._other = None
 
-                    self.Parameters[p] = val
+        gcode_line = gcode_line.strip()
+        self._text = gcode_line
+        self._dirty = False
+
+        if gcode_line.startswith(";"):
+            self.Comment = gcode_line[1:]
+            return
+
+        match = _LINE.match(gcode_line)
+        if match is None:
+            # empty line
+            return
+
+        command, raw, self.Comment = match.groups()
+        self.Command = command[0]
+        self.Command_value = command[1:]
+        self.fullcommand = command
+        if raw:
+            self._raw = raw
+
+    def _decode(self):
+        raw = self._raw
+        self._raw = None
+        present = self._present
+        for field in raw.split():
+            parameter = field[0]
+            value = field[1:]
+            try:
+                if "." in value:
+                    value = float(value)
+                else:
+                    value = int(value)
+            except ValueError:
+                pass
 
-                fields = fields[1:]
+            if parameter == "X":
+                self._X = value
+                present |= 1
+            elif parameter == "Y":
+                self._Y = value
+                present |= 2
+            elif parameter == "E":
+                self._E = value
+                present |= 8
+            elif parameter == "F":
+                self._F = value
+                present |= 16
+            elif parameter == "Z":
+                self._Z = value
+                present |= 4
+            else:
+                if self._other is None:
+                    self._other = {}
+                self._other[parameter] = value
+        self._present = present
+
+    def _set_parameter(self, parameter, value):
+        flag = _FIXED_PARAMETERS.get(parameter)
+        if flag is None:
+            if self._other is None:
+                self._other = {}
+            self._other[parameter] = value
+            return
+
+        self._present |= flag
+        if parameter == "X":
+            self._X = value
+        elif parameter == "Y":
+            self._Y = value
+        elif parameter == "Z":
+            self._Z = value
+        elif parameter == "E":
+            self._E = value
+        else:
+            self._F = value
 
-            self.X = self.get_parameter("X", None)
-            self.Y = self.get_parameter("Y", None)
-            self.Z = self.get_parameter("Z", None)
-            self.E = self.get_parameter("E", None)
+    def _fixed_value(self, parameter):
+        if parameter == "X":
+            return self._X
+        if parameter == "Y":
+            return self._Y
+        if parameter == "Z":
+            return self._Z
+        if parameter == "E":
+            return self._E
+        return self._F
+
+    def _parameter_items(self):
+        if self._raw is not None:
+            self._decode()
+        items = []
+        if self._present:
+            for key in "XYZEF":
+                if self._present & _FIXED_PARAMETERS[key]:
+                    items.append((key, self._fixed_value(key)))
+        if self._other:
+            items.extend(self._other.items())
+        return items
+
+    @property
+    def Parameters(self):
+        return dict(self._parameter_items())
+
+    @property
+    def X(self):
+        if self._raw is not None:
+            self._decode()
+        return self._X
+
+    @X.setter
+    def X(self, value):
+        if self._raw is not None:
+            self._decode()
+        self._X = value
+
+    @property
+    def Y(self):
+        if self._raw is not None:
+            self._decode()
+        return self._Y
+
+    @Y.setter
+    def Y(self, value):
+        if self._raw is not None:
+            self._decode()
+        self._Y = value
+
+    @property
+    def Z(self):
+        if self._raw is not None:
+            self._decode()
+        return self._Z
+
+    @Z.setter
+    def Z(self, value):
+        if self._raw is not None:
+            self._decode()
+        self._Z = value
+
+    @property
+    def E(self):
+        if self._raw is not None:
+            self._decode()
+        return self._E
+
+    @E.setter
+    def E(self, value):
+        if self._raw is not None:
+            self._decode()
+        self._E = value
 
     def __str__(self):
+        if not self._dirty:
+            return self._text + "\n"
+
         p = ""
 
+        items = self._parameter_items()
+
         # use the same formatting as prusa to ease file compares (X, Y, Z, E, F)
 
         sorted_keys = "XYZE"
         if self.is_movement_command():
-            for key in sorted_keys:
-                if key in self.Parameters:
+            for key, value in items:
+                if key in sorted_keys:
                     form = ""
                     if key in "XYZ":
                         form = "{}{:0.3f} "
                     if key == "E":
                         form = "{}{:0.5f} "
-                    value = self.Parameters[key]
                     if value == None:
-                        gui.log_warning("GCode error detected, file might not print correctly")
+                        # commands are formatted while the output is written, the warning is only logged
+                        gui.create_logitem("GCode error detected, file might not print correctly", "red")
                         value = ""
 
                     p = p + form.format(key, value)
 
-        for key in self.Parameters:
+        for key, value in items:
             if not self.is_movement_command() or key not in sorted_keys:
-                value = self.Parameters[key]
                 if value == None:
                     value = ""
 
@@ -120,46 +253,49 @@ class GCodeCommand:
         return ("{} {} {}".format(c, p, co)).strip() + "\n"
 
     def update_parameter(self, parameter, value):
-        self.Parameters[parameter] = value
-        if parameter == "X":
-            self.X = value
-        if parameter == "Y":
-            self.Y = value
-        if parameter == "Z":
-            self.Z = value
-        if parameter == "E":
-            self.E = value
+        if self._raw is not None:
+            self._decode()
+        self._set_parameter(parameter, value)
+        self._dirty = True
 
     def remove_parameter(self, parameter):
-        if parameter in self.Parameters:
+        if self.has_parameter(parameter):
+            self._dirty = True
+            value = self.get_parameter(parameter)
             if self.Comment:
-                self.Comment = "[R_{}{}] ".format(parameter, self.Parameters[parameter]) + self.Comment
+                self.Comment = "[R_{}{}] ".format(parameter, value) + self.Comment
             else:
-                self.Comment = "[R_{}{}] ".format(parameter, self.Parameters[parameter])
-            self.Parameters.pop(parameter)
+                self.Comment = "[R_{}{}] ".format(parameter, value)
 
-            if parameter == "X":
-                self.X = None
-            if parameter == "Y":
-                self.Y = None
-            if parameter == "Z":
-                self.Z = None
-            if parameter == "E":
-                self.E = None
+            flag = _FIXED_PARAMETERS.get(parameter)
+            if flag is None:
+                self._other.pop(parameter)
+                return
 
+            self._present &= ~flag
+            if parameter == "X":
+                self._X = None
+            elif parameter == "Y":
+                self._Y = None
+            elif parameter == "Z":
+                self._Z = None
+            elif parameter == "E":
+                self._E = None
+            else:
+                self._F = None
 
     def move_to_comment(self, text):
         if self.Command:
             self.Comment = "-- P2PP -- removed [{}] - {}".format(text, self)
 
+        self._dirty = True
         self.Command = None
         self.Command_value = None
         self.fullcommand = None
-        self.X = None
-        self.Y = None
-        self.Z = None
-        self.E = None
-        self.Parameters.clear()
+        self._raw = None
+        self._present = 0
+        self._X = self._Y = self._Z = self._E = self._F = None
+        self._other = None
 
     def has_E(self):
         return self.E is not None
@@ -180,44 +316,53 @@ class GCodeCommand:
             return self.Comment
 
     def has_parameter(self, parametername):
-        return parametername in self.Parameters
+        if self._raw is not None:
+            self._decode()
+        flag = _FIXED_PARAMETERS.get(parametername)
+        if flag is None:
+            return self._other is not None and parametername in self._other
+        return (self._present & flag) != 0
 
     def get_parameter(self, parm , defaultvalue = 0 ):
         if self.has_parameter(parm):
-            return self.Parameters[parm]
+            if parm in _FIXED_PARAMETERS:
+                return self._fixed_value(parm)
+            return self._other[parm]
         return defaultvalue
 
-    def issue_command(self):
+    def issue_command(self, ctx):
         if self.E is not None and self.is_movement_command():
-            v.total_material_extruded += self.E * v.extrusion_multiplier * v.extrusion_multiplier_correction
-            v.material_extruded_per_color[
-                v.current_tool] += self.E * v.extrusion_multiplier * v.extrusion_multiplier_correction
-            v.purge_count += self.E * v.extrusion_multiplier * v.extrusion_multiplier_correction
-        v.processed_gcode.append(str(self))
-        # v.processed_gcode.append(  "[{}]  {} ".format(v.classes[self.Class],str(self)))
-
-    def issue_command_speed(self, speed):
+            ctx.total_material_extruded += self.E * ctx.extrusion_multiplier * ctx.extrusion_multiplier_correction
+            ctx.material_extruded_per_color[
+                ctx.current_tool] += self.E * ctx.extrusion_multiplier * ctx.extrusion_multiplier_correction
+            ctx.purge_count += self.E * ctx.extrusion_multiplier * ctx.extrusion_multiplier_correction
+        ctx.processed_gcode.append(self)
+        # ctx.processed_gcode.append(  "[{}]  {} ".format(ctx.classes[self.Class],str(self)))
+
+    def issue_command_speed(self, ctx, speed):
         s = str(self)
         s = s.replace("%SPEED%", "{:0.0f}".format(speed))
         if self.E is not None and self.is_movement_command():
-            v.total_material_extruded += self.E * v.extrusion_multiplier * v.extrusion_multiplier_correction
-            v.material_extruded_per_color[
-                v.current_tool] += self.E * v.extrusion_multiplier * v.extrusion_multiplier_correction
-            v.purge_count += self.E * v.extrusion_multiplier * v.extrusion_multiplier_correction
+            ctx.total_material_extruded += self.E * ctx.extrusion_multiplier * ctx.extrusion_multiplier_correction
+            ctx.material_extruded_per_color[
+                ctx.current_tool] += self.E * ctx.extrusion_multiplier * ctx.extrusion_multiplier_correction
+            ctx.purge_count += self.E * ctx.extrusion_multiplier * ctx.extrusion_multiplier_correction
 
-        v.processed_gcode.append(s)
+        # the purge sequences are reused, issue a copy with the speed filled in
+        ctx.processed_gcode.append(GCodeCommand(s))
 
     def add_comment(self, text):
         if self.Comment:
             self.Comment += text
         else:
             self.Comment = text
+        self._dirty = True
 
     def is_comment(self):
         return self.Command is None and not (self.Comment is None)
 
     def is_movement_command(self):
-        return self.Command == "G" and self.Command_value in ['0', '1', '2', '3', '5', '10', '11']
+        return self.fullcommand in MOVEMENT_COMMANDS
 
     def is_z_positioning(self):
         return self.is_movement_command() and self.has_Z()
@@ -239,6 +384,43 @@ class GCodeCommand:
             return self.fullcommand == "G11"
 
 
-def issue_code(s):
-    GCodeCommand(s).issue_command()
+class AbsoluteExtrusion(object):
+    # Renders commands with absolute extrusion while they are written, relative E values are added up
+    # and the extruder position is reset every RESET_LENGTH mm.
+
+    RESET_LENGTH = 3000.0
+
+    def __init__(self):
+        self.absolute = None
+
+    def render(self, command):
+        prefix = ""
+
+        if self.absolute is not None and self.absolute > self.RESET_LENGTH:
+            prefix = "G92 E0.000    ;Extruder counter reset\n"
+            self.absolute = 0.0
+
+        if command.is_movement_command() and command.has_parameter("E"):
+            # if there is no filament reset code, make sure one is inserted before first extrusion
+            if self.absolute is None:
+                prefix += "G92 E0.00\n"
+                self.absolute = 0.0
+
+            self.absolute += command.E
+            command.update_parameter("E", self.absolute)
+
+        elif command.fullcommand == "M83":
+            return prefix + "M82\n"
+
+        elif command.fullcommand == "G92":
+            if command.has_parameter("E"):
+                self.absolute = command.E
+            elif len(command.Parameters) == 0:
+                self.absolute = 0.0
+
+        return prefix + str(command)
+
+
+def issue_code(ctx, s):
+    GCodeCommand(s).issue_command(ctx)
 
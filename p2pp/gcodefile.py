@@ -0,0 +1,111 @@
+__author__ = 'Tom Van den Eede'
+__copyright__ = 'Copyright 2018-2020, Palette2 Splicer Post Processing Project'
+__credits__ = ['Tom Van den Eede',
+               'Tim Brookman'
+               ]
+__license__ = 'GPLv3'
+__maintainer__ = 'Tom Van den Eede'
+__email__ = 'P2PP@pandora.be'
+
+import mmap
+import os
+import shutil
+import tempfile
+from array import array
+from collections import deque
+
+try:
+    # python 3.x
+    array('Q')
+    OFFSET_TYPE = 'Q'
+except ValueError:
+    # python 2.x
+    OFFSET_TYPE = 'L'
+
+
+class GCodeFile(object):
+    # The input GCode file, memory mapped.  Only the start offset of every line is kept, lines are
+    # sliced from the map and decoded when they are requested.  Lines are returned stripped.
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = open(filename, 'rb')
+        self.size = os.path.getsize(filename)
+        if self.size > 0:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            # an empty file cannot be mapped
+            self._map = b''
+        self.offsets = self._index()
+
+    def _index(self):
+        offsets = array(OFFSET_TYPE, [0])
+        find = self._map.find
+        append = offsets.append
+        position = find(b'\n')
+        while position >= 0:
+            position += 1
+            append(position)
+            position = find(b'\n', position)
+        # the last line has no newline, the end of the file closes it
+        if offsets[-1] < self.size:
+            append(self.size)
+        return offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError("line index out of range")
+        return self._map[self.offsets[idx]:self.offsets[idx + 1]].decode('utf-8').strip()
+
+    def __iter__(self):
+        data = self._map
+        offsets = self.offsets
+        for idx in range(len(offsets) - 1):
+            yield data[offsets[idx]:offsets[idx + 1]].decode('utf-8').strip()
+
+    def __reversed__(self):
+        data = self._map
+        offsets = self.offsets
+        for idx in range(len(offsets) - 2, -1, -1):
+            yield data[offsets[idx]:offsets[idx + 1]].decode('utf-8').strip()
+
+    def close(self):
+        # the map must be closed before the input file can be overwritten by the output
+        if self.size > 0:
+            self._map.close()
+        self._file.close()
+
+
+class GCodeWriter(object):
+    # Collects the processed GCode in a temporary file.  The last commands issued stay in tail as GCodeCommand
+    # objects so they can still be changed, they are only rendered to text when they leave the window.
+    # render turns a command into text, it can be replaced by an output stage (e.g. absolute extrusion).
+
+    def __init__(self, tail_size=10, render=str):
+        self.tail_size = tail_size
+        self.tail = deque()
+        self.render = render
+        self._file = tempfile.TemporaryFile(mode="w+")
+
+    def append(self, line):
+        self.tail.append(line)
+        if len(self.tail) > self.tail_size:
+            self._file.write(self.render(self.tail.popleft()))
+
+    def flush(self):
+        while self.tail:
+            self._file.write(self.render(self.tail.popleft()))
+        self._file.flush()
+
+    def copy_to(self, opf):
+        self.flush()
+        self._file.seek(0)
+        shutil.copyfileobj(self._file, opf)
+
+    def close(self):
+        self._file.close()
@@ -8,9 +8,9 @@ __maintainer__ = 'Tom Van den Eede'
 __email__ = 'P2PP@pandora.be'
 
 import math
+from collections import OrderedDict
 
 import p2pp.gui as gui
-import p2pp.variables as v
 
 
 def gcode_remove_params(gcode, params):
@@ -46,276 +46,234 @@ def get_gcode_parameter(gcode, parameter, default=None):
     return default
 
 
-def split_csv_strings(s):
+def split_csv_strings(value):
     newvalues = []
-    keyval = s.split("=")
-    if len(keyval) > 1:
-        keyword = keyval[0]
-        value = ("=".join(keyval[1:])).strip(' ')
-        values = value.split(";")
-        tmp = None
-        idx = 0
-        while idx < len(values):
-            if tmp is None:
-                tmp = values[idx]
-            else:
-                tmp += values[idx]
-            if len(tmp) >= 2:
-                if tmp[0] == '"' and tmp[-1] == '"':
-                    tmp = tmp[1:-1]
-                    res = ""
-                    tmp = tmp.replace(" ", "_")
-                    for i in list(tmp):
-                        if i in "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz_-":
-                            res = res + i
-                    newvalues.append(res)
-
-                    tmp = ""
-            idx += 1
+    values = value.strip(' ').split(";")
+    tmp = None
+    idx = 0
+    while idx < len(values):
+        if tmp is None:
+            tmp = values[idx]
+        else:
+            tmp += values[idx]
+        if len(tmp) >= 2:
+            if tmp[0] == '"' and tmp[-1] == '"':
+                tmp = tmp[1:-1]
+                res = ""
+                tmp = tmp.replace(" ", "_")
+                for i in list(tmp):
+                    if i in "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz_-":
+                        res = res + i
+                newvalues.append(res)
+
+                tmp = ""
+        idx += 1
     return newvalues
 
 
-def filament_volume_to_length(x):
-    return x / (v.filament_diameter[v.current_tool] / 2 * v.filament_diameter[v.current_tool] / 2 * math.pi)
-
-
-def parse_slic3r_config():
-    for idx in range(len(v.input_gcode) - 1, -1, -1):
-
-        gcode_line = v.input_gcode[idx]
-
-        if gcode_line.startswith("; filament_settings_id"):
-            v.filament_ids = split_csv_strings(gcode_line)
-
-        if ("generated by PrusaSlicer") in gcode_line:
-            try:
-                s1 = gcode_line.split("+")
-                s2 = s1[0].split(" ")
-                v.ps_version = s2[-1]
-                gui.create_logitem("File was created with PS version:{}".format(v.ps_version))
-                if v.ps_version < "2.2":
-                    gui.log_warning("This version of P2PP is optimized to work with PS2.2!")
-            except:
-                pass
-            continue
-
-        if gcode_line.startswith("; wipe_tower_no_sparse_layers"):
-            parameter_start = gcode_line.find("=")
-            if parameter_start != -1:
-                try:
-                    v.wipe_remove_sparse_layers = (int(gcode_line[parameter_start + 1:].strip()) == 1)
-                except:
-                    pass
-            continue
-
-
-        if gcode_line.startswith("; wipe_tower_x"):
-            parameter_start = gcode_line.find("=")
-            if parameter_start != -1:
-                v.wipetower_posx = float(gcode_line[parameter_start + 1:].strip())
-            continue
-
-        if gcode_line.startswith("; min_skirt_length"):
-            parameter_start = gcode_line.find("=")
-            if parameter_start != -1:
-                v.skirtsize = float(gcode_line[parameter_start + 1:].strip())
-            continue
-
-        if gcode_line.startswith("; skirts"):
-            parameter_start = gcode_line.find("=")
-            if parameter_start != -1:
-                v.skirts = float(gcode_line[parameter_start + 1:].strip())
-            continue
-
-
-        if gcode_line.startswith("; wipe_tower_width"):
-            parameter_start = gcode_line.find("=")
-            if parameter_start != -1:
-                v.wipetower_width = float(gcode_line[parameter_start + 1:].strip())
-            continue
-
-        if gcode_line.startswith("; wipe_tower_y"):
-            parameter_start = gcode_line.find("=")
-            if parameter_start != -1:
-                v.wipetower_posy = float(gcode_line[parameter_start + 1:].strip())
-            continue
-
-        if gcode_line.startswith("; extrusion_width"):
-            parameter_start = gcode_line.find("=")
-            if parameter_start != -1:
-                v.extrusion_width = float(gcode_line[parameter_start + 1:].strip())
-            continue
+def filament_volume_to_length(ctx, x):
+    return x / (ctx.filament_diameter[ctx.current_tool] / 2 * ctx.filament_diameter[ctx.current_tool] / 2 * math.pi)
 
-        if gcode_line.startswith("; infill_speed"):
-            parameter_start = gcode_line.find("=")
-            if parameter_start != -1:
-                v.infill_speed = float(gcode_line[parameter_start + 1:].strip()) * 60
-            continue
 
-        if gcode_line.startswith("; layer_height"):
-            parameter_start = gcode_line.find("=")
-            if parameter_start != -1:
-                v.layer_height = float(gcode_line[parameter_start + 1:].strip())
-            continue
+def float_setting(name, factor=1):
+    def handler(ctx, value):
+        setattr(ctx, name, float(value) * factor)
 
-        if gcode_line.startswith("; first_layer_height"):
-            parameter_start = gcode_line.find("=")
-            if parameter_start != -1:
-                v.first_layer_height = float(gcode_line[parameter_start + 1:].strip())
-            continue
+    return handler
 
-        if gcode_line.startswith("; support_material_synchronize_layers"):
-            parameter_start = gcode_line.find("=")
-            if parameter_start != -1:
-                tmp = float(gcode_line[parameter_start + 1:].strip())
-                if tmp == 0:
-                    v.synced_support = False
-                else:
-                    v.synced_support = True
-            continue
 
-        if gcode_line.startswith("; support_material "):
-            parameter_start = gcode_line.find("=")
-            if parameter_start != -1:
-                tmp = float(gcode_line[parameter_start + 1:].strip())
-                if tmp == 0:
-                    v.support_material = False
-                else:
-                    v.support_material = True
-            continue
+def config_filament_settings_id(ctx, value):
+    ctx.filament_ids = split_csv_strings(value)
 
-        # TVDE: needs to be expanded to be able to support more than 4 colors
-        if gcode_line.startswith("; extruder_colour") or gcode_line.startswith("; filament_colour"):
-            filament_colour = ''
-            parameter_start = gcode_line.find("=")
-            gcode_line = gcode_line[parameter_start + 1:].strip()
-            parameter_start = gcode_line.find("#")
-            if parameter_start != -1:
-                filament_colour = gcode_line.split(";")
-            if len(filament_colour) >= 4:
-                for i in range(len(filament_colour)):
-                    if filament_colour[i] == "":
-                        filament_colour[i] = v.filament_color_code[i]
-                    else:
-                        v.filament_color_code[i] = filament_colour[i][1:]
-            continue
 
+def config_wipe_tower_no_sparse_layers(ctx, value):
+    try:
+        ctx.wipe_remove_sparse_layers = (int(value) == 1)
+    except:
+        pass
 
-        if gcode_line.startswith("; filament_diameter"):
-            parameter_start = gcode_line.find("=")
-            if parameter_start != -1:
-                filament_diameters = gcode_line[parameter_start + 1:].strip(" ").split(",")
-                if len(filament_diameters) >= 4:
-                    for i in range(4):
-                        v.filament_diameter[i] = float(filament_diameters[i])
-            continue
 
-        # TVDE: needs to be expanded to be able to support more than 4 colors
-        # only check that is needed is that if nore than 4 colors exist, all must be of same type
-        if gcode_line.startswith("; filament_type"):
-            parameter_start = gcode_line.find("=")
-            if parameter_start != -1:
-                filament_string = gcode_line[parameter_start + 1:].strip(" ").split(";")
-                v.m4c_numberoffilaments = len(filament_string)
-                if v.m4c_numberoffilaments == 4:
-                    v.filament_type = filament_string
-                    v.used_filament_types = list(set(filament_string))
-                elif v.m4c_numberoffilaments >= 4:
-                    v.used_filament_types = list(set(filament_string))
-                    if len(v.used_filament_types) > 1:
-                        gui.log_warning("Prints with more than 4 colors should be of one filament type only!")
-                        gui.log_warning("This file will not print correctly")
-                    v.filament_type = filament_string[:4]
-
-            if v.m4c_numberoffilaments > 4:
-                gui.log_warning(
-                    "Number of inputs defined in print: {}.  Swaps may be required!!!".format(v.m4c_numberoffilaments))
+def config_support_material_synchronize_layers(ctx, value):
+    ctx.synced_support = float(value) != 0
 
-            continue
 
-        # TVDE: needs to be expanded to be able to support more than 4 colors
-        # if more than 4, just retain the first four (check is done at other level, but for not all settings should be the same)
-
-        if gcode_line.startswith("; retract_lift = "):
-            if v.filament_list:
-                continue
-            lift_error = False
-            parameter_start = gcode_line.find("=")
-            if parameter_start != -1:
-                retracts = gcode_line[parameter_start + 1:].strip(" ").split(",")
-                if len(retracts) >= 4:
-                    for i in range(4):
-                        v.retract_lift[i] = float(retracts[i])
-                        if v.retract_lift[i] == 0:
-                            lift_error = True
-                if lift_error:
-                    gui.log_warning(
-                        "[Printer Settings]->[Extruders 1 -> {}]->[Retraction]->[Lift Z] should not be set to zero.".format(
-                            len(retracts)))
-                    gui.log_warning(
-                        "Generated file might not print correctly")
-            continue
+def config_support_material(ctx, value):
+    ctx.support_material = float(value) != 0
 
-        # TVDE: needs to be expanded to be able to support more than 4 colors
-        # if more than 4, just retain the first four (check is done at other level, but for not all settings should be the same)
-        if gcode_line.startswith("; retract_length = "):
-            retract_error = False
-            parameter_start = gcode_line.find("=")
-            if parameter_start != -1:
-                retracts = gcode_line[parameter_start + 1:].strip(" ").split(",")
-                if len(retracts) >= 4:
-                    for i in range(4):
-                        v.retract_length[i] = float(retracts[i])
-                        if v.retract_length[i] == 0.0:
-                            retract_error = True
-                if retract_error:
-                    gui.log_warning(
-                        "[Printer Settings]->[Extruders 1 -> {} 4]->[Retraction Length] should not be set to zero.".format(
-                            len(retracts)))
-            continue
 
-        if gcode_line.startswith("; gcode_flavor"):
-            if "reprap" in gcode_line:
-                v.isReprap_Mode = True
-            continue
-
-        if "use_firmware_retraction" in gcode_line:
-            parameter_start = gcode_line.find("=")
-            if parameter_start != -1:
-                gcode_line = gcode_line[parameter_start + 1:].replace(";", "")
-                if "1" in gcode_line:
-                    v.use_firmware_retraction = True
-                else:
-                    v.use_firmware_retraction = False
-            continue
-
-        if "use_relative_e_distances" in gcode_line:
-            parameter_start = gcode_line.find("=")
-            if parameter_start != -1:
-                gcode_line = gcode_line[parameter_start + 1:].replace(";", "")
-                if "1" in gcode_line:
-                    v.gcode_has_relative_e = True
-                else:
-                    v.gcode_has_relative_e = False
-            continue
-
-        # TVDE: needs to be expanded to be able to support more than 4 colors
-        # this should be expanded to nxn filaments where n = the number of filaments used.
-        # needs to be a perfect square, calculate from there.
-        if gcode_line.startswith("; wiping_volumes_matrix"):
-            wiping_info = []
-            parameter_start = gcode_line.find("=")
-            if parameter_start != -1:
-                wiping_info = gcode_line[parameter_start + 1:].strip(" ").split(",")
-                _warning = True
-                for i in range(len(wiping_info)):
-                    if int(wiping_info[i]) != 140 and int(wiping_info[i]) != 0:
-                        _warning = False
-
-                    wiping_info[i] = filament_volume_to_length(float(wiping_info[i]))
-            v.max_wipe = max(wiping_info)
-            v.wiping_info = wiping_info
-            if _warning:
-                gui.log_warning("All purge lenghts 70/70 OR 140.  Purge lenghts may not have been set correctly.")
+# TVDE: needs to be expanded to be able to support more than 4 colors
+def config_filament_colour(ctx, value):
+    filament_colour = ''
+    if value.find("#") != -1:
+        filament_colour = value.split(";")
+    if len(filament_colour) >= 4:
+        for i in range(len(filament_colour)):
+            if filament_colour[i] == "":
+                filament_colour[i] = ctx.filament_color_code[i]
+            else:
+                ctx.filament_color_code[i] = filament_colour[i][1:]
+
+
+def config_filament_diameter(ctx, value):
+    filament_diameters = value.split(",")
+    if len(filament_diameters) >= 4:
+        for i in range(4):
+            ctx.filament_diameter[i] = float(filament_diameters[i])
+
+
+# TVDE: needs to be expanded to be able to support more than 4 colors
+# only check that is needed is that if nore than 4 colors exist, all must be of same type
+def config_filament_type(ctx, value):
+    filament_string = value.split(";")
+    ctx.m4c_numberoffilaments = len(filament_string)
+    if ctx.m4c_numberoffilaments == 4:
+        ctx.filament_type = filament_string
+        ctx.used_filament_types = list(set(filament_string))
+    elif ctx.m4c_numberoffilaments >= 4:
+        ctx.used_filament_types = list(set(filament_string))
+        if len(ctx.used_filament_types) > 1:
+            ctx.log_warning("Prints with more than 4 colors should be of one filament type only!")
+            ctx.log_warning("This file will not print correctly")
+        ctx.filament_type = filament_string[:4]
+
+    if ctx.m4c_numberoffilaments > 4:
+        ctx.log_warning(
+            "Number of inputs defined in print: {}.  Swaps may be required!!!".format(ctx.m4c_numberoffilaments))
+
+
+# TVDE: needs to be expanded to be able to support more than 4 colors
+# if more than 4, just retain the first four (check is done at other level, but for not all settings should be the same)
+def config_retract_lift(ctx, value):
+    if ctx.filament_list:
+        return
+    lift_error = False
+    retracts = value.split(",")
+    if len(retracts) >= 4:
+        for i in range(4):
+            ctx.retract_lift[i] = float(retracts[i])
+            if ctx.retract_lift[i] == 0:
+                lift_error = True
+    if lift_error:
+        ctx.log_warning(
+            "[Printer Settings]->[Extruders 1 -> {}]->[Retraction]->[Lift Z] should not be set to zero.".format(
+                len(retracts)))
+        ctx.log_warning(
+            "Generated file might not print correctly")
+
+
+# TVDE: needs to be expanded to be able to support more than 4 colors
+# if more than 4, just retain the first four (check is done at other level, but for not all settings should be the same)
+def config_retract_length(ctx, value):
+    retract_error = False
+    retracts = value.split(",")
+    if len(retracts) >= 4:
+        for i in range(4):
+            ctx.retract_length[i] = float(retracts[i])
+            if ctx.retract_length[i] == 0.0:
+                retract_error = True
+    if retract_error:
+        ctx.log_warning(
+            "[Printer Settings]->[Extruders 1 -> {} 4]->[Retraction Length] should not be set to zero.".format(
+                len(retracts)))
+
+
+def config_gcode_flavor(ctx, value):
+    if "reprap" in value:
+        ctx.isReprap_Mode = True
+
+
+def config_use_firmware_retraction(ctx, value):
+    ctx.use_firmware_retraction = "1" in value.replace(";", "")
+
+
+def config_use_relative_e_distances(ctx, value):
+    ctx.gcode_has_relative_e = "1" in value.replace(";", "")
+
+
+# TVDE: needs to be expanded to be able to support more than 4 colors
+# this should be expanded to nxn filaments where n = the number of filaments used.
+# needs to be a perfect square, calculate from there.
+def config_wiping_volumes_matrix(ctx, value):
+    wiping_info = value.split(",")
+    _warning = True
+    for i in range(len(wiping_info)):
+        if int(wiping_info[i]) != 140 and int(wiping_info[i]) != 0:
+            _warning = False
+
+        wiping_info[i] = filament_volume_to_length(ctx, float(wiping_info[i]))
+    ctx.max_wipe = max(wiping_info)
+    ctx.wiping_info = wiping_info
+    if _warning:
+        ctx.log_warning("All purge lenghts 70/70 OR 140.  Purge lenghts may not have been set correctly.")
+
+
+SLIC3R_CONFIG_HANDLERS = {
+    "filament_settings_id": config_filament_settings_id,
+    "wipe_tower_no_sparse_layers": config_wipe_tower_no_sparse_layers,
+    "wipe_tower_x": float_setting("wipetower_posx"),
+    "wipe_tower_y": float_setting("wipetower_posy"),
+    "wipe_tower_width": float_setting("wipetower_width"),
+    "min_skirt_length": float_setting("skirtsize"),
+    "skirts": float_setting("skirts"),
+    "extrusion_width": float_setting("extrusion_width"),
+    "infill_speed": float_setting("infill_speed", 60),
+    "layer_height": float_setting("layer_height"),
+    "first_layer_height": float_setting("first_layer_height"),
+    "support_material_synchronize_layers": config_support_material_synchronize_layers,
+    "support_material": config_support_material,
+    "extruder_colour": config_filament_colour,
+    "filament_colour": config_filament_colour,
+    "filament_diameter": config_filament_diameter,
+    "filament_type": config_filament_type,
+    "retract_lift": config_retract_lift,
+    "retract_length": config_retract_length,
+    "gcode_flavor": config_gcode_flavor,
+    "use_firmware_retraction": config_use_firmware_retraction,
+    "use_relative_e_distances": config_use_relative_e_distances,
+    "wiping_volumes_matrix": config_wiping_volumes_matrix,
+}
+
+
+def read_slic3r_config(ctx):
+    # the slicer configuration is the block of "; key = value" lines at the end of the file,
+    # returned in file order.  A key that appears twice keeps its first value, as it always did.
+    lines = []
+    for gcode_line in reversed(ctx.input_gcode):
+        if gcode_line == "":
             continue
-
+        parameter_start = gcode_line.find("=")
+        if not gcode_line.startswith("; ") or parameter_start == -1:
+            break
+        lines.append((gcode_line[2:parameter_start].strip(), gcode_line[parameter_start + 1:].strip()))
+    lines.reverse()
+
+    config = OrderedDict()
+    for key, value in lines:
+        if key not in config:
+            config[key] = value
+    return config
+
+
+def parse_slic3r_config(ctx):
+    config = read_slic3r_config(ctx)
+
+    # settings are applied from the end of the file to the start, settings that depend on each other
+    # (extruder_colour overrules filament_colour) rely on this order
+    for key in reversed(config):
+        handler = SLIC3R_CONFIG_HANDLERS.get(key)
+        if handler is not None:
+            handler(ctx, config[key])
+
+    for idx in range(min(10, len(ctx.input_gcode))):
+        gcode_line = ctx.input_gcode[idx]
+        if ("generated by PrusaSlicer") in gcode_line:
+            try:
+                s1 = gcode_line.split("+")
+                s2 = s1[0].split(" ")
+                ctx.ps_version = s2[-1]
+                gui.create_logitem("File was created with PS version:{}".format(ctx.ps_version))
+                if ctx.ps_version < "2.2":
+                    ctx.log_warning("This version of P2PP is optimized to work with PS2.2!")
+            except:
+                pass
+            break
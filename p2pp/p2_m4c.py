@@ -10,8 +10,6 @@ __email__ = 'P2PP@pandora.be'
 from copy import deepcopy
 
 import p2pp.formatnumbers as fn
-import p2pp.gcode as gcode
-import p2pp.variables as v
 from p2pp.colornames import find_nearest_colour
 
 
@@ -49,114 +47,112 @@ def find_last_used(l, u):
             return l.index(u[-i])
 
 
-def find_previous_tool_replaced(tool, index):
+def find_previous_tool_replaced(ctx, tool, index):
     while index > 0:
-        if v.m4c_toolchanges[index] == tool:
+        if ctx.m4c_toolchanges[index] == tool:
             return index
         index -= 1
     return -1
 
 
-def patchup_toolchanges():
+def patchup_toolchanges(ctx):
     # when we have only 4 extruders defined, keep the user defined input settings from PrusaSlicer
-    if v.m4c_numberoffilaments == 4:
+    if ctx.m4c_numberoffilaments == 4:
         return
 
     # otherwise replace the color with the right color offset.
-    for idx in range(len(v.m4c_toolchange_source_positions)):
-        try:
-            old = v.parsed_gcode[v.m4c_toolchange_source_positions[idx]]
-        except:
-            old = v.parsed_gcode[v.m4c_toolchange_source_positions[-1]]
+    for idx in range(len(ctx.m4c_toolchange_source_positions)):
+        position = ctx.m4c_toolchange_source_positions[idx]
+        old_tool = ctx.parsed_gcode.tool[position]
 
-        _ip = calculate_input_index(idx, int(old.Command_value))
-        v.parsed_gcode[v.m4c_toolchange_source_positions[idx]] = gcode.GCodeCommand(
-            "T{} ; INPUT MAPPING MORE THAN 4 COLORS {} --> {}".format(_ip, _ip, int(old.Command_value)))
+        _ip = calculate_input_index(ctx, idx, old_tool)
+        ctx.parsed_gcode.replace(position,
+                               "T{} ; INPUT MAPPING MORE THAN 4 COLORS {} --> {}".format(_ip, _ip, old_tool))
 
 
-def calculate_loadscheme():
+def calculate_loadscheme(ctx):
     # input :
-    #   v.splice_used_tool is the list of color changes
+    #   ctx.splice_used_tool is the list of color changes
     # output:
-    #   v.m4c_loadedinputs = list of loaded inputs per slice
-    #   v.m4c_late_warning = list of swaps when prints MUST me paused
-    #   v.m4c_early_warning = list of swaps when EARLY warning needs to be given
+    #   ctx.m4c_loadedinputs = list of loaded inputs per slice
+    #   ctx.m4c_late_warning = list of swaps when prints MUST me paused
+    #   ctx.m4c_early_warning = list of swaps when EARLY warning needs to be given
     #
 
     nexttools = []
 
-    for idx in range(len(v.m4c_toolchanges)):
-        nexttools.append(calc_next(-1, v.m4c_toolchanges[idx:]))
+    for idx in range(len(ctx.m4c_toolchanges)):
+        nexttools.append(calc_next(-1, ctx.m4c_toolchanges[idx:]))
 
     loadedinputs = deepcopy(nexttools[0][:4])
     loadedinputs.sort()
 
-    for idx in range(len(v.m4c_toolchanges) - 2):
+    for idx in range(len(ctx.m4c_toolchanges) - 2):
 
-        newtool = v.m4c_toolchanges[idx + 2]
+        newtool = ctx.m4c_toolchanges[idx + 2]
 
-        v.m4c_early_warning.append([])
+        ctx.m4c_early_warning.append([])
 
         # checkif there is a tool we can unload
         if not newtool in loadedinputs:
             input_to_replace = find_last_used(loadedinputs, nexttools[idx])
             tool_replaced = loadedinputs[input_to_replace]
-            v.m4c_late_warning.append([input_to_replace, tool_replaced, newtool])
+            ctx.m4c_late_warning.append([input_to_replace, tool_replaced, newtool])
             # print("{} FROM Loaded {} - Next {} ".format(input_to_replace, loadedinputs, nexttools[idx]))
             # print ("Splice {} Changing Input {} from {} to {}".format(idx,input_to_replace, tool_replaced, newtool ))
             loadedinputs[input_to_replace] = newtool
 
-            last_used = find_previous_tool_replaced(tool_replaced, idx)
+            last_used = find_previous_tool_replaced(ctx, tool_replaced, idx)
             if last_used > 0 and not last_used + 1 == idx:
-                v.m4c_late_warning[-1].append(last_used + 1)
+                ctx.m4c_late_warning[-1].append(last_used + 1)
             else:
-                v.m4c_late_warning[-1].append(-1)
+                ctx.m4c_late_warning[-1].append(-1)
 
-            v.m4c_late_warning[-1].append(idx)
+            ctx.m4c_late_warning[-1].append(idx)
         else:
-            v.m4c_late_warning.append([])
+            ctx.m4c_late_warning.append([])
 
-        v.m4c_loadedinputs.append(deepcopy(loadedinputs))
+        ctx.m4c_loadedinputs.append(deepcopy(loadedinputs))
 
-    v.m4c_loadedinputs.append(deepcopy(loadedinputs))
-    v.m4c_loadedinputs.append(deepcopy(loadedinputs))
+    ctx.m4c_loadedinputs.append(deepcopy(loadedinputs))
+    ctx.m4c_loadedinputs.append(deepcopy(loadedinputs))
 
-    if v.m4c_numberoffilaments <= 4:
-        for idx in v.m4c_loadedinputs[0]:
-            v.palette_inputs_used[idx] = True
+    if ctx.m4c_numberoffilaments <= 4:
+        for idx in ctx.m4c_loadedinputs[0]:
+            ctx.palette_inputs_used[idx] = True
     else:
-        for idx in range(len(v.m4c_loadedinputs[0])):
-            v.palette_inputs_used[idx] = True
+        for idx in range(len(ctx.m4c_loadedinputs[0])):
+            ctx.palette_inputs_used[idx] = True
 
-    patchup_toolchanges()
+    patchup_toolchanges(ctx)
 
 
 ########################################################################
 # the following function gets the input index of s apecific loaded color
 # the returned value is 0-based
 ########################################################################
-def calculate_input_index(swap, color):
+def calculate_input_index(ctx, swap, color):
     try:
-        return v.m4c_loadedinputs[swap].index(color)
+        return ctx.m4c_loadedinputs[swap].index(color)
     except:
         return 0
 
 
-def generate_warninglist():
+def generate_warninglist(ctx):
     template = "O500 {} {} {} {} {} {}"
 
     result = []
 
     hotswapID = 256
 
-    for tmp_value in v.m4c_late_warning:
+    for tmp_value in ctx.m4c_late_warning:
         if len(tmp_value) > 0:
-            source = "D{}{}{}".format(v.filament_color_code[tmp_value[1]].strip("\n"),
-                                      find_nearest_colour(v.filament_color_code[tmp_value[1]].strip("\n")),
-                                      v.filament_type[0].strip("\n"))
-            target = "D{}{}{}".format(v.filament_color_code[tmp_value[2]].strip("\n"),
-                                      find_nearest_colour(v.filament_color_code[tmp_value[2]].strip("\n")),
-                                      v.filament_type[0].strip("\n"))
+            source = "D{}{}{}".format(ctx.filament_color_code[tmp_value[1]].strip("\n"),
+                                      find_nearest_colour(ctx.filament_color_code[tmp_value[1]].strip("\n")),
+                                      ctx.filament_type[0].strip("\n"))
+            target = "D{}{}{}".format(ctx.filament_color_code[tmp_value[2]].strip("\n"),
+                                      find_nearest_colour(ctx.filament_color_code[tmp_value[2]].strip("\n")),
+                                      ctx.filament_type[0].strip("\n"))
             result.append(template.format(fn.hexify_short(hotswapID),
                                           fn.hexify_byte(tmp_value[0]),
                                           source,
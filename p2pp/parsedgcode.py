@@ -0,0 +1,113 @@
+__author__ = 'Tom Van den Eede'
+__copyright__ = 'Copyright 2018-2020, Palette2 Splicer Post Processing Project'
+__credits__ = ['Tom Van den Eede',
+               'Tim Brookman'
+               ]
+__license__ = 'GPLv3'
+__maintainer__ = 'Tom Van den Eede'
+__email__ = 'P2PP@pandora.be'
+
+from array import array
+
+import p2pp.gcode as gcode
+
+NAN = float("nan")
+
+
+def _number(value):
+    # parameters that are missing or not numeric are stored as NaN
+    if value is None:
+        return NAN
+    try:
+        return float(value)
+    except ValueError:
+        return NAN
+
+
+def _value(number):
+    if number != number:
+        return None
+    return number
+
+
+class ParsedGCode(object):
+    # Pre-parsed GCode stored column wise, one row per input line.  The row number is the line number
+    # in the input, the GCodeCommand for a row is only rebuilt from the input line when it is processed.
+
+    def __init__(self):
+        self.replaced = {}
+
+        self.commands = [None]
+        self._command_ids = {None: 0}
+
+        self.command = array('H')
+        self.block_class = array('B')
+        self.tool = array('b')
+        self.layer = array('i')
+        self.x = array('d')
+        self.y = array('d')
+        self.z = array('d')
+        self.e = array('d')
+        self.f = array('d')
+
+    def __len__(self):
+        return len(self.block_class)
+
+    def append(self, code, block_class, tool):
+        command_id = self._command_ids.get(code.fullcommand)
+        if command_id is None:
+            command_id = len(self.commands)
+            self.commands.append(code.fullcommand)
+            self._command_ids[code.fullcommand] = command_id
+
+        self.command.append(command_id)
+        self.block_class.append(block_class)
+        self.tool.append(tool)
+        self.layer.append(code.Layer)
+
+        if code.Command is None:
+            self.x.append(NAN)
+            self.y.append(NAN)
+            self.z.append(NAN)
+            self.e.append(NAN)
+            self.f.append(NAN)
+        else:
+            self.x.append(_number(code.X))
+            self.y.append(_number(code.Y))
+            self.z.append(_number(code.Z))
+            self.e.append(_number(code.E))
+            self.f.append(_number(code.get_parameter("F", None)))
+
+    def fullcommand(self, idx):
+        return self.commands[self.command[idx]]
+
+    def get_X(self, idx):
+        return _value(self.x[idx])
+
+    def get_Y(self, idx):
+        return _value(self.y[idx])
+
+    def get_Z(self, idx):
+        return _value(self.z[idx])
+
+    def get_E(self, idx):
+        return _value(self.e[idx])
+
+    def is_movement_command(self, idx):
+        return self.fullcommand(idx) in gcode.MOVEMENT_COMMANDS
+
+    def is_xy_positioning(self, idx):
+        return (self.is_movement_command(idx) and self.x[idx] == self.x[idx] and self.y[idx] == self.y[idx] and
+                self.e[idx] != self.e[idx])
+
+    def replace(self, idx, line):
+        self.replaced[idx] = line
+
+    def get_command(self, idx, line):
+        if idx in self.replaced:
+            line = self.replaced[idx]
+        code = gcode.GCodeCommand(line)
+        code.Class = self.block_class[idx]
+        code.Tool = self.tool[idx]
+        code.Layer = self.layer[idx]
+        return code
@@ -0,0 +1,125 @@
+__author__ = 'Tom Van den Eede'
+__copyright__ = 'Copyright 2018-2020, Palette2 Splicer Post Processing Project'
+__credits__ = ['Tom Van den Eede',
+               'Tim Brookman'
+               ]
+__license__ = 'GPLv3'
+__maintainer__ = 'Tom Van den Eede'
+__email__ = 'P2PP@pandora.be'
+
+# --profile: runs a job under cProfile (cpu) or tracemalloc (mem) and writes the reports next to the output file,
+# so a user can send them along with a problem report.
+#
+#   cpu  <name>.pstats        for pstats/snakeviz/...
+#        <name>.profile.txt   the top functions by cumulative and by own time
+#   mem  <name>.memory.txt    memory in use and peak per stage, and the lines holding the most memory at the
+#                             busiest stage boundary or checkpoint (the end of the generate loop)
+
+import cProfile
+import pstats
+
+try:
+    import tracemalloc
+except ImportError:
+    # python version 2.x
+    tracemalloc = None
+
+# python 3.9 and later, without it the peak per stage is the peak so far
+reset_peak = getattr(tracemalloc, "reset_peak", None)
+
+import p2pp.gui as gui
+import p2pp.timing as timing
+
+KINDS = ("cpu", "mem")
+TOP = 25
+
+
+class SnapshotTimer(timing.StageTimer):
+    # Follows the traced memory per stage, the memory in use at the end of a stage and the peak while it ran.
+    # Takes a tracemalloc snapshot at every stage boundary and checkpoint, keeps the one with the most memory in use.
+
+    def __init__(self):
+        timing.StageTimer.__init__(self)
+        self.stage_memory = []  # (stage, in use at the end, peak while running)
+        self.snapshot = None
+        self.snapshot_point = None
+        self.snapshot_size = -1
+
+    def take_snapshot(self, point):
+        current, peak = tracemalloc.get_traced_memory()
+        if current > self.snapshot_size:
+            self.snapshot = tracemalloc.take_snapshot()
+            self.snapshot_size = current
+            self.snapshot_point = point
+        return current, peak
+
+    def checkpoint(self, point):
+        self.take_snapshot(point)
+
+    def switch(self, name):
+        if self.current is not None:
+            current, peak = self.take_snapshot("end of stage " + self.current)
+            self.stage_memory.append((self.current, current, peak))
+            if reset_peak is not None:
+                reset_peak()
+        timing.StageTimer.switch(self, name)
+
+
+def profile_cpu(function, ctx, args, name, top):
+    profile = cProfile.Profile()
+    try:
+        profile.runcall(function, ctx, *args)
+    finally:
+        profile.dump_stats(name + ".pstats")
+        with open(name + ".profile.txt", "w") as opf:
+            stats = pstats.Stats(profile, stream=opf)
+            stats.strip_dirs()
+            opf.write("Top {} functions by cumulative time\n\n".format(top))
+            stats.sort_stats("cumulative").print_stats(top)
+            opf.write("Top {} functions by own time\n\n".format(top))
+            stats.sort_stats("tottime").print_stats(top)
+
+    gui.create_logitem("CPU profile written to {0}.pstats and {0}.profile.txt".format(name), "blue")
+
+
+def profile_memory(function, ctx, args, name, top):
+    ctx.timer = SnapshotTimer()
+    tracemalloc.start()
+    try:
+        function(ctx, *args)
+    finally:
+        tracemalloc.stop()
+
+    timer = ctx.timer
+    peak = max([0] + [stage[2] for stage in timer.stage_memory])
+    with open(name + ".memory.txt", "w") as opf:
+        opf.write("Peak traced memory: {:.1f} MB\n\n".format(peak / 1024.0 / 1024.0))
+        opf.write("{:<25} {:>12} {:>12}\n".format("Stage", "End (MB)", "Peak (MB)"))
+        for stage, current, stage_peak in timer.stage_memory:
+            opf.write("{:<25} {:>12.1f} {:>12.1f}\n".format(stage, current / 1024.0 / 1024.0,
+                                                             stage_peak / 1024.0 / 1024.0))
+        if timer.snapshot is not None:
+            # a snapshot can not be taken at the peak itself, the peak per stage is in the table above
+            opf.write("\nTop {} lines holding memory at the {} ({:.1f} MB), the stage boundary or checkpoint with "
+                      "the most memory in use\n\n".format(top, timer.snapshot_point,
+                                                          timer.snapshot_size / 1024.0 / 1024.0))
+            for stat in timer.snapshot.statistics("lineno")[:top]:
+                opf.write("{}\n".format(stat))
+
+    gui.create_logitem("Memory profile written to {}.memory.txt, peak {:.1f} MB".format(name,
+                                                                                   peak / 1024.0 / 1024.0), "blue")
+
+
+def supported(kind):
+    return kind == "cpu" or tracemalloc is not None
+
+
+def profiled(kind, function, name, top=TOP):
+    # returns function wrapped in the profiler, called as function(ctx, *args) like mcf.generate
+    def run(ctx, *args):
+        if kind == "cpu":
+            profile_cpu(function, ctx, args, name, top)
+        else:
+            profile_memory(function, ctx, args, name, top)
+
+    return run
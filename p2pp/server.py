@@ -0,0 +1,115 @@
+__author__ = 'Tom Van den Eede'
+__copyright__ = 'Copyright 2018-2020, Palette2 Splicer Post Processing Project'
+__credits__ = ['Tom Van den Eede',
+               'Tim Brookman'
+               ]
+__license__ = 'GPLv3'
+__maintainer__ = 'Tom Van den Eede'
+__email__ = 'P2PP@pandora.be'
+
+# Resident P2PP server: all modules are imported once, every request is handled by a forked child process so each
+# job starts from the clean state of the server.  p2ppclient.py sends a request over a unix socket, one JSON line
+# with the file to process, and gets the result of batch.process_file back as one JSON line.
+#
+# Needs fork and unix sockets, not available on Windows.
+
+import json
+import os
+import socket
+import sys
+
+import p2pp.batch as batch
+
+SOCKET_PATH = os.path.join(os.path.expanduser("~"), ".p2pp.sock")  # also used by p2ppclient.py
+ACCEPT_TIMEOUT = 1.0  # finished children are reaped at least this often
+
+
+def supported():
+    return hasattr(os, "fork") and hasattr(socket, "AF_UNIX")
+
+
+def read_line(conn):
+    data = b""
+    while not data.endswith(b"\n"):
+        chunk = conn.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    return data.decode("utf-8")
+
+
+def handle_request(conn):
+    try:
+        request = json.loads(read_line(conn))
+        result = batch.process_file(request["input"],
+                                    request.get("output"),
+                                    request.get("printer_profile", ""),
+                                    request.get("splice_offset", 40.0),
+                                    request.get("log")
+                                    )
+    except Exception as e:
+        result = {"status": "error",
+                  "error": "{}: {}".format(type(e).__name__, e)}
+    conn.sendall((json.dumps(result) + "\n").encode("utf-8"))
+
+
+def reap_children():
+    try:
+        while os.waitpid(-1, os.WNOHANG)[0] > 0:
+            pass
+    except OSError:
+        # no children left
+        pass
+
+
+def open_socket(path):
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except socket.error:
+            # left behind by a server that did not stop cleanly
+            os.unlink(path)
+        else:
+            probe.close()
+            raise IOError("A P2PP server is already listening on {}".format(path))
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(16)
+    listener.settimeout(ACCEPT_TIMEOUT)
+    return listener
+
+
+def serve(path=SOCKET_PATH):
+    listener = open_socket(path)
+    print("P2PP server listening on {} - Ctrl-C to stop".format(path))
+    sys.stdout.flush()
+
+    try:
+        while True:
+            reap_children()
+            try:
+                conn, address = listener.accept()
+            except socket.timeout:
+                continue
+
+            if os.fork() == 0:
+                # child: handle this one request and leave without running any cleanup of the server
+                status = 0
+                try:
+                    listener.close()
+                    handle_request(conn)
+                except BaseException:
+                    status = 1
+                finally:
+                    os._exit(status)
+
+            conn.close()
+
+    except KeyboardInterrupt:
+        print("P2PP server stopped")
+
+    finally:
+        listener.close()
+        os.unlink(path)
@@ -0,0 +1,88 @@
+__author__ = 'Tom Van den Eede'
+__copyright__ = 'Copyright 2018-2020, Palette2 Splicer Post Processing Project'
+__credits__ = ['Tom Van den Eede',
+               'Tim Brookman'
+               ]
+__license__ = 'GPLv3'
+__maintainer__ = 'Tom Van den Eede'
+__email__ = 'P2PP@pandora.be'
+
+import json
+from collections import OrderedDict
+
+try:
+    from time import monotonic
+except ImportError:
+    # python version 2.x
+    from time import time as monotonic
+
+
+class StageTimer(object):
+    # Wall clock time per processing stage.  One stage runs at a time, switch ends the running stage and starts
+    # the next one, so the stage times add up to the total.  Stages are kept in the order they first ran.
+
+    def __init__(self):
+        self.stages = OrderedDict()
+        self.current = None
+        self.started = None
+        self.nested = []  # [name, time spent, time already booked] for the functions wrapped by timed
+        self.tracer = None  # gets a span for every stage, see p2pp.tracing
+
+    def switch(self, name):
+        now = monotonic()
+        if self.current is not None:
+            elapsed = now - self.started
+            self.stages.setdefault(self.current, 0.0)
+            for entry in self.nested:
+                spent = entry[1][0] - entry[2]
+                if spent > 0:
+                    entry[2] += spent
+                    elapsed -= spent
+                    self.stages[entry[0]] = self.stages.get(entry[0], 0.0) + spent
+            self.stages[self.current] = self.stages.get(self.current, 0.0) + elapsed
+            if self.tracer is not None:
+                self.tracer.stage(self.current, self.started, now)
+        self.current = name
+        self.started = now
+
+    def stop(self):
+        self.switch(None)
+
+    def checkpoint(self, point):
+        # a point inside a stage worth a look, see p2pp.profiling
+        pass
+
+    def total(self):
+        # completed stages only
+        return sum(self.stages.values())
+
+    def timed(self, name, function):
+        # For a stage that runs in small pieces inside other stages, e.g. the conversion to absolute extrusion
+        # while the output is written.  The wrapper only adds up its own time, which is moved out of the running
+        # stage at the next switch, switching for every call would cost more than the conversion itself.
+        spent = [0.0]
+
+        def wrapper(*args):
+            start = monotonic()
+            result = function(*args)
+            spent[0] += monotonic() - start
+            return result
+
+        self.nested.append([name, spent, 0.0])
+        return wrapper
+
+
+def write_stats(ctx, filename, input_file, output_file):
+    stats = OrderedDict()
+    stats["input"] = input_file
+    stats["output"] = output_file
+    stats["version"] = ctx.version
+    stats["lines"] = len(ctx.parsed_gcode) if ctx.parsed_gcode is not None else 0
+    stats["total"] = round(ctx.timer.total(), 6)
+    stats["stages"] = OrderedDict((name, round(seconds, 6)) for name, seconds in ctx.timer.stages.items())
+    stats["splices"] = len(ctx.splice_extruder_position)
+    stats["pings"] = len(ctx.ping_extruder_position)
+    stats["warnings"] = len(ctx.process_warnings)
+
+    with open(filename, "w") as opf:
+        json.dump(stats, opf, indent=2)
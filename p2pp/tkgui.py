@@ -0,0 +1,426 @@
+__author__ = 'Tom Van den Eede'
+__copyright__ = 'Copyright 2018-2020, Palette2 Splicer Post Processing Project'
+__credits__ = ['Tom Van den Eede',
+               'Tim Brookman'
+               ]
+__license__ = 'GPLv3'
+__maintainer__ = 'Tom Van den Eede'
+__email__ = 'P2PP@pandora.be'
+
+# Tk front end, the main window is built when this module is imported (see p2pp.gui)
+
+try:
+    # p ython version 2.x
+    import Tkinter as tkinter
+    import ttk
+    import tkMessageBox
+except ImportError:
+    # python version 3.x
+    import tkinter
+    from tkinter import ttk
+    from tkinter import messagebox as tkMessageBox
+
+try:
+    # python version 2.x
+    import Queue as queue
+except ImportError:
+    # python version 3.x
+    import queue
+
+import os
+import sys
+import threading
+import traceback
+from platform import system
+
+try:
+    from time import monotonic
+except ImportError:
+    # python version 2.x
+    from time import time as monotonic
+
+import p2pp.colornames as colornames
+import p2pp.variables as v
+import version
+
+platformD = system()
+
+# log lines are queued and the window is only repainted every UPDATE_INTERVAL seconds, repainting Tk for every
+# message or progress step would make the processing time depend on the number of log lines
+UPDATE_INTERVAL = 0.05
+
+last_pct = -1
+last_update = 0.0
+pending_log = []
+
+# run_job processes the file on a worker thread, the worker (or any other background thread such as the version
+# check) never touches Tk.  Log lines go to pending_log (list.append is atomic), everything else is posted to the
+# events queue that poll_events runs on the Tk thread.
+main_thread = threading.current_thread()
+worker = None
+worker_exit = None
+job_context = None  # ProcessingContext of the running job
+events = queue.Queue()
+close_requested = False
+close_enabled = False
+interactive = True
+
+
+def in_worker():
+    return threading.current_thread() is not main_thread
+
+
+def post(function, *args):
+    events.put((function, args))
+
+
+def call_in_main(function, *args):
+    # runs function on the Tk thread, when called from the worker it waits for the result
+    if not in_worker():
+        return function(*args)
+    reply = queue.Queue()
+
+    def run():
+        # always reply, an error is raised again on the worker
+        try:
+            reply.put((function(*args), None))
+        except Exception as e:
+            reply.put((None, e))
+
+    post(run)
+    result, error = reply.get()
+    if error is not None:
+        raise error
+    return result
+
+
+def insert_log():
+    global last_update
+    # the worker may append while the queue is inserted, only remove what was taken
+    lines = pending_log[:]
+    del pending_log[:len(lines)]
+    for position, text, color in lines:
+        loglist.insert(position, text, color_tag(color))
+    last_update = monotonic()
+
+
+def flush_log():
+    insert_log()
+    mainwindow.update()
+
+
+def show_progress(pct, warnings=0):
+    if pct == 100:
+        if warnings == 0:
+            completed("  COMPLETED OK", '#008000')
+        else:
+            completed("  COMPLETED WITH WARNINGS",'#800000')
+    else:
+        progress.set(pct)
+
+
+def progress_string(pct, warnings=0):
+    global last_pct
+    if last_pct == pct:
+        return
+    last_pct = pct
+    if in_worker():
+        post(show_progress, pct, warnings)
+    elif pct == 100 or monotonic() - last_update >= UPDATE_INTERVAL:
+        show_progress(pct, warnings)
+        flush_log()
+
+def completed(text, color):
+    progressbar.destroy()
+    progress_field = tkinter.Label(infosubframe , text=text, font=boldfont, foreground=color,  background="#808080")
+    progress_field.grid(row=3, column=2, sticky="ew")
+
+color_tags = {}
+
+
+def color_tag(color):
+    # one text tag per color, not one per line
+    tagname = color_tags.get(color)
+    if tagname is None:
+        tagname = "color" + str(len(color_tags))
+        loglist.tag_configure(tagname, foreground=color)
+        color_tags[color] = tagname
+    return tagname
+
+
+def create_logitem(text, color="black", force_update=True, position=None):
+    if position is None:
+        position = tkinter.END
+    text = text.strip()
+    pending_log.append((position, "  " + text + "\n", color))
+    if force_update and not in_worker() and monotonic() - last_update >= UPDATE_INTERVAL:
+        flush_log()
+
+
+def create_colordefinition(reporttype, input, filament_type, color_code, filamentused, filament_id=""):
+    if reporttype == 0:
+        name = "Input"
+    if reporttype == 1:
+        name = "Filament"
+
+    tagname = 'black'
+    tagname2 = "#" + color_code
+
+    if reporttype == 0:
+        pending_log.append((tkinter.END, "  \t{}  {} {:-8.2f}mm - {}".format(name, input, filamentused, filament_type),
+                            tagname))
+    if reporttype == 1:
+        pending_log.append((tkinter.END, "  \t{}  {}  - {}".format(name, input, filament_type), tagname))
+
+    pending_log.append((tkinter.END, "  \t[####]\t", tagname2))
+    pending_log.append((tkinter.END, "  \t{:15} {} \n".format(colornames.find_nearest_colour(color_code), filament_id),
+                        tagname))
+
+
+def create_emptyline():
+    create_logitem('')
+
+def close_window():
+    global close_requested
+    if worker is not None:
+        # closing the window cancels the job, the window closes when the worker has stopped
+        close_requested = True
+        cancel_job()
+        return
+    mainwindow.destroy()
+
+
+def cancel_job():
+    if worker is not None and not job_context.cancel_requested:
+        job_context.cancel_requested = True
+        cancelbutton.config(state=tkinter.DISABLED)
+        create_logitem("Cancelling...", "red")
+
+
+def run_job(function, ctx, *args):
+    global worker, job_context, close_enabled
+    job_context = ctx
+    job_context.cancel_requested = False
+    close_enabled = False
+
+    def job():
+        global worker_exit
+        try:
+            function(ctx, *args)
+        except SystemExit as e:
+            worker_exit = e
+        except Exception:
+            traceback.print_exc()
+            create_logitem("Processing failed: {}".format(sys.exc_info()[1]), "red")
+            post(enable_close_button)
+
+    worker = threading.Thread(target=job, name="p2pp-worker")
+    worker.daemon = True
+    cancelbutton.config(state=tkinter.NORMAL)
+    worker.start()
+    mainwindow.mainloop()
+
+    if worker_exit is not None:
+        raise worker_exit
+
+
+def poll_events():
+    finished = worker is not None and not worker.is_alive()
+    while True:
+        try:
+            function, args = events.get_nowait()
+        except queue.Empty:
+            break
+        function(*args)
+    insert_log()
+
+    if finished and job_finished():
+        return
+    mainwindow.after(int(UPDATE_INTERVAL * 1000), poll_events)
+
+
+def job_finished():
+    global worker
+    worker = None
+    cancelbutton.config(state=tkinter.DISABLED)
+    if job_context.cancel_requested and not close_requested:
+        enable_close_button()
+    if close_requested or worker_exit is not None or not close_enabled:
+        mainwindow.destroy()
+        return True
+    return False
+
+
+def enable_close_button():
+    global close_enabled
+    close_enabled = True
+    closebutton.config(state=tkinter.NORMAL)
+
+def update_button_pressed():
+    v.upgradeprocess(version.latest_stable_version, [])
+
+def close_button_enable(consolewait=False):
+    if in_worker():
+        # run_job keeps the main loop running once the button is enabled
+        post(enable_close_button)
+        return
+    flush_log()
+    enable_close_button()
+    # WIP disable upgrade for now
+    # if not (v.upgradeprocess == None):
+    #     tkinter.Button(buttonframe, text='Upgrade to '+version.latest_stable_version, command=update_button_pressed).pack(side=tkinter.RIGHT)
+    mainwindow.mainloop()
+
+
+def center(win, width, height):
+    win.update_idletasks()
+    x = (win.winfo_screenwidth() // 2) - (width // 2)  # center horizontally in screen
+    y = (win.winfo_screenheight() // 2) - (height // 2)  # center vertically in screen
+    win.geometry('{}x{}+{}+{}'.format(width, height, x, y))
+    win.minsize(int(width / 1.2), int(height / 1.2))
+    win.maxsize(width * 4, height * 4)
+
+
+def set_printer_id(text):
+    if in_worker():
+        post(printerid.set, text)
+    else:
+        printerid.set(text)
+
+
+def setfilename(text):
+    if in_worker():
+        post(filename.set, text)
+    else:
+        filename.set(text)
+
+
+def user_error(header, body_text):
+    call_in_main(show_user_error, header, body_text)
+
+
+def show_user_error(header, body_text):
+    insert_log()
+    tkMessageBox.showinfo(header, body_text)
+
+
+def ask_yes_no(title, message):
+    return call_in_main(show_yes_no, title, message)
+
+
+def show_yes_no(title, message):
+    insert_log()
+    return (tkMessageBox.askquestion(title, message).upper()=="YES")
+
+
+def configinfo():
+    if in_worker():
+        post(configinfo)
+        return
+    global infosubframe
+    infosubframe.destroy()
+    infosubframe = tkinter.Frame(infoframe, border=3, relief='sunken', background="#909090")
+    infosubframe.pack(side=tkinter.TOP, fill=tkinter.BOTH, expand=1)
+    tkinter.Label(infosubframe, text='CONFIGURATION  INFO', font=boldfontlarge, background="#909090").pack(side=tkinter.TOP, expand=1)
+
+    tkinter.Label(infosubframe, text="P2PP Version "+version.Version+"\n", font=boldfont, background="#909090").pack( side=tkinter.BOTTOM)
+
+
+mainwindow = tkinter.Tk()
+mainwindow.title("Palette2 Post Processing for PrusaSliceer")
+center(mainwindow, 800, 620)
+
+if platformD == 'Windows':
+    logo_image = os.path.dirname(sys.argv[0]) + '\\favicon.ico'
+    mainwindow.iconbitmap(logo_image)
+    mainwindow.update()
+
+mainwindow['padx'] = 10
+mainwindow['pady'] = 10
+boldfontlarge = 'Helvetica 30 bold'
+normalfont = 'Helvetica 15'
+boldfont = 'Helvetica 15 bold'
+fixedfont = 'Courier 14'
+fixedsmallfont = 'Courier 12'
+
+# Top Information Frqme
+infoframe = tkinter.Frame(mainwindow, border=3, relief='flat', background="#808080")
+infoframe.pack(side=tkinter.TOP, fill=tkinter.X)
+
+# logo
+logoimage = tkinter.PhotoImage(file=os.path.dirname(sys.argv[0]) + "/appicon.ppm")
+logofield = tkinter.Label(infoframe, image=logoimage)
+logofield.pack(side=tkinter.LEFT, fill=tkinter.Y)
+
+infosubframe = tkinter.Frame(infoframe, relief='flat', background="#808080")
+infosubframe.pack(side=tkinter.LEFT, fill=tkinter.X, )
+infosubframe["padx"] = 20
+
+# file name display
+tkinter.Label(infosubframe, text='Filename:', font=boldfont, background="#808080").grid(row=0, column=1, sticky="w")
+filename = tkinter.StringVar()
+setfilename("-----")
+tkinter.Label(infosubframe, textvariable=filename, font=normalfont, background="#808080").grid(row=0, column=2,
+                                                                                               sticky="w")
+
+# printer ID display
+printerid = tkinter.StringVar()
+set_printer_id("-----")
+
+tkinter.Label(infosubframe, text='Printer ID:', font=boldfont, background="#808080").grid(row=1, column=1, sticky="w")
+tkinter.Label(infosubframe, textvariable=printerid, font=normalfont, background="#808080").grid(row=1, column=2,
+                                                                                                sticky="w")
+
+
+tkinter.Label(infosubframe, text="P2PP Version:", font=boldfont, background="#808080").grid(row=2, column=1,
+                                                                                            sticky="w")
+tkinter.Label(infosubframe, text=version.Version, font=normalfont, background="#808080").grid(row=2, column=2,
+                                                                                              sticky="w")
+
+# progress bar
+progress = tkinter.IntVar()
+progress.set(0)
+tkinter.Label(infosubframe, text='Progress:', font=boldfont, background="#808080").grid(row=3, column=1, sticky="w")
+progressbar = ttk.Progressbar(infosubframe ,orient='horizontal', mode='determinate', length=500, maximum=100, variable=progress)
+progressbar.grid(row=3, column=2,  sticky='ew')
+
+
+# Log frame
+logframe = tkinter.Frame(mainwindow, border=3, relief="sunken")
+logframe.pack(side=tkinter.TOP, fill=tkinter.BOTH, expand=1)
+
+yloglistscroll = tkinter.Scrollbar(logframe, orient=tkinter.VERTICAL)
+yloglistscroll.pack(side='right', fill=tkinter.Y)
+
+xloglistscroll = tkinter.Scrollbar(logframe, orient=tkinter.HORIZONTAL)
+xloglistscroll.pack(side='bottom', fill=tkinter.X)
+
+loglist = tkinter.Text(logframe, yscrollcommand=yloglistscroll.set, xscrollcommand=xloglistscroll.set, wrap="none",
+                       font=fixedsmallfont)
+loglist.pack(side=tkinter.LEFT, fill=tkinter.BOTH, expand=True)
+
+yloglistscroll.config(command=loglist.yview)
+xloglistscroll.config(command=loglist.xview)
+
+# Button frame
+buttonframe = tkinter.Frame(mainwindow, border=1, relief="flat")
+buttonframe.pack(side=tkinter.BOTTOM, fill=tkinter.X)
+
+closebutton = tkinter.Button(buttonframe, text="Exit", state=tkinter.DISABLED, command=close_window, height=2)
+closebutton.pack(side=tkinter.LEFT, fill=tkinter.BOTH, expand=True)
+
+cancelbutton = tkinter.Button(buttonframe, text="Cancel", state=tkinter.DISABLED, command=cancel_job, height=2)
+cancelbutton.pack(side=tkinter.RIGHT, fill=tkinter.BOTH, expand=True)
+
+mainwindow.protocol("WM_DELETE_WINDOW", close_window)
+mainwindow.after(int(UPDATE_INTERVAL * 1000), poll_events)
+
+mainwindow.rowconfigure(0, weight=1000)
+mainwindow.rowconfigure(1, weight=2)
+mainwindow.rowconfigure(2, weight=1000)
+
+mainwindow.lift()
+mainwindow.attributes('-topmost', True)
+mainwindow.after_idle(mainwindow.attributes, '-topmost', False)
+mainwindow.update()
+
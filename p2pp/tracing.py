@@ -0,0 +1,138 @@
+__author__ = 'Tom Van den Eede'
+__copyright__ = 'Copyright 2018-2020, Palette2 Splicer Post Processing Project'
+__credits__ = ['Tom Van den Eede',
+               'Tim Brookman'
+               ]
+__license__ = 'GPLv3'
+__maintainer__ = 'Tom Van den Eede'
+__email__ = 'P2PP@pandora.be'
+
+# --trace: Chrome trace event file (open with https://ui.perfetto.dev or chrome://tracing) with a span per
+# processing stage, per layer and per block of lines with the same block class in the generate loop, and
+# instant events for splices, pings and tower skips.
+#
+# Nothing is traced unless a tracer is set on the context, the generate loop then calls the traced version of
+# gcode_parseline, otherwise the plain one.
+
+import json
+import os
+
+try:
+    from time import monotonic
+except ImportError:
+    # python version 2.x
+    from time import time as monotonic
+
+# one track (thread id in the trace) per kind of span
+STAGE_TRACK = 1
+LAYER_TRACK = 2
+BLOCK_TRACK = 3
+EVENT_TRACK = 4
+
+TRACK_NAMES = {STAGE_TRACK: "Stages",
+               LAYER_TRACK: "Layers",
+               BLOCK_TRACK: "Blocks",
+               EVENT_TRACK: "Splices, pings and tower skips"}
+
+
+class Tracer(object):
+
+    def __init__(self):
+        self.origin = monotonic()
+        self.pid = os.getpid()
+        self.events = []
+        for track, name in TRACK_NAMES.items():
+            self.events.append({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": track,
+                                "args": {"name": name}})
+
+        # open layer and block spans in the generate loop: (value, start time, first line)
+        self.layer = None
+        self.block = None
+        self.splices = 0
+        self.pings = 0
+        self.towerskipped = False
+
+    def timestamp(self, seconds):
+        # monotonic seconds to microseconds since the start of the trace
+        return round((seconds - self.origin) * 1000000.0, 1)
+
+    def span(self, name, category, start, end, track, args=None):
+        event = {"name": name, "cat": category, "ph": "X", "pid": self.pid, "tid": track,
+                 "ts": self.timestamp(start), "dur": round((end - start) * 1000000.0, 1)}
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def stage(self, name, start, end):
+        self.span(name, "stage", start, end, STAGE_TRACK)
+
+    def instant(self, name, category, args=None):
+        event = {"name": name, "cat": category, "ph": "i", "s": "t", "pid": self.pid, "tid": EVENT_TRACK,
+                 "ts": self.timestamp(monotonic())}
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def trace_lines(self, ctx, parseline):
+        # returns parseline (mcf.gcode_parseline) wrapped to follow layers, blocks and events line by line
+        parsed = ctx.parsed_gcode
+        self.splices = len(ctx.splice_extruder_position)
+        self.pings = len(ctx.ping_extruder_position)
+        self.towerskipped = ctx.towerskipped
+
+        def traced(ctx, index, line):
+            layer = parsed.layer[index]
+            block = parsed.block_class[index]
+            if self.layer is None or layer != self.layer[0] or block != self.block[0]:
+                now = monotonic()
+                if self.layer is None or layer != self.layer[0]:
+                    self.end_layer(now, index)
+                    self.layer = (layer, now, index)
+                if self.block is None or block != self.block[0]:
+                    self.end_block(ctx, now, index)
+                    self.block = (block, now, index)
+
+            parseline(ctx, index, line)
+            self.check_events(ctx, layer)
+
+        return traced
+
+    def end_layer(self, now, index):
+        if self.layer is not None:
+            layer, start, first = self.layer
+            self.span("Layer {}".format(layer), "layer", start, now, LAYER_TRACK, {"lines": index - first})
+            self.layer = None
+
+    def end_block(self, ctx, now, index):
+        if self.block is not None:
+            block, start, first = self.block
+            name = ctx.classes.get(block, "Class {}".format(block)).strip()
+            self.span(name, "block", start, now, BLOCK_TRACK, {"lines": index - first})
+            self.block = None
+
+    def check_events(self, ctx, layer):
+        if len(ctx.splice_extruder_position) != self.splices:
+            for position in ctx.splice_extruder_position[self.splices:]:
+                self.instant("Splice", "splice", {"position": round(position, 2), "layer": layer})
+            self.splices = len(ctx.splice_extruder_position)
+
+        if len(ctx.ping_extruder_position) != self.pings:
+            for position in ctx.ping_extruder_position[self.pings:]:
+                self.instant("Ping", "ping", {"position": round(position, 2), "layer": layer})
+            self.pings = len(ctx.ping_extruder_position)
+
+        if ctx.towerskipped != self.towerskipped:
+            self.towerskipped = ctx.towerskipped
+            if self.towerskipped:
+                self.instant("Tower skip", "towerskip", {"layer": layer})
+
+    def end_lines(self, ctx, index):
+        # the end of the generate loop, the last splice is added after it
+        now = monotonic()
+        self.end_layer(now, index)
+        self.end_block(ctx, now, index)
+        self.check_events(ctx, None)
+
+    def write(self, filename):
+        with open(filename, "w") as opf:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, opf)
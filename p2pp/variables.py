@@ -8,10 +8,10 @@ __license__ = 'GPLv3'
 __maintainer__ = 'Tom Van den Eede'
 __email__ = 'P2PP@pandora.be'
 
-import re
-
 #########################################
 # Variable default values
+#
+# every job works on its own copy of these values, see p2pp.context.ProcessingContext
 #########################################
 
 # Filament Transition Table
@@ -61,8 +61,8 @@ printer_profile_string = ''
 default_printerprofile = '50325050494e464f'
 # A unique ID linked to a printer configuration profile in the Palette 2 hardware.
 
-input_gcode = []
-processed_gcode = []  # final output array with Gcode
+input_gcode = None  # type: GCodeFile  # memory mapped input file
+processed_gcode = None  # type: GCodeWriter  # processed output, written to a temporary file
 
 # These variables are used to build the splice information table (Omega-30 commands in GCode) that drives the Palette2.
 # spliceoffset allows for a correction of the position at which the transition occurs.
@@ -160,9 +160,15 @@ min_start_splice_length = 100  # type: int  # Minimum first splice length.
 
 gui = True  # Enabled/Disabled by --gui switch - enables GUI Mode which requires tkinter.
 consolewait = False
+cancel_requested = False  # set by the GUI Cancel button, processing stops at the next line
+output_written = False  # set by generate once the output file is complete
 
 version = "0.0.0"
 processtime = 0
+timer = None  # type: StageTimer  # time per processing stage, see p2pp.timing
+stats_json = None  # file to write the stage times to (--stats-json)
+trace_file = None  # file to write the trace events to (--trace)
+tracer = None  # type: Tracer  # see p2pp.tracing, only set when tracing
 
 versioncheck = False
 upgradeprocess = None
@@ -171,7 +177,7 @@ full_purge_reduction = False
 purge_first_empty = True
 purgelayer = 0
 
-parsed_gcode = []
+parsed_gcode = None  # type: ParsedGCode  # column store filled by mcf.parse_gcode
 _obsolete_gcodeclass = []
 _obsolete_linetool = []
 _obsolete_parsecomment = []
@@ -262,6 +268,25 @@ classes = {
 
 }
 
+# purge tower sequences (purgetower.py)
+solidlayer = []
+emptylayer = []
+filllayer = []
+brimlayer = []
+
+current_purge_form = 1  # PURGE_SOLID
+current_purge_index = 0
+
+sequence_length_solid = 0
+sequence_length_empty = 0
+sequence_length_brim = 0
+
+last_posx = None
+last_posy = None
+
+last_brim_x = None
+last_brim_y = None
+
 ### more than 4 color prints
 ############################
 m4c_enabled = False
@@ -276,4 +301,3 @@ m4c_numberoffilaments = 4
 
 m4c_headerinfo = []
 
-regex_p2pp = re.compile("^;\s*P2PP\s+([^=]+)=?(.*)$")
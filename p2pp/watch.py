@@ -0,0 +1,152 @@
+__author__ = 'Tom Van den Eede'
+__copyright__ = 'Copyright 2018-2020, Palette2 Splicer Post Processing Project'
+__credits__ = ['Tom Van den Eede',
+               'Tim Brookman'
+               ]
+__license__ = 'GPLv3'
+__maintainer__ = 'Tom Van den Eede'
+__email__ = 'P2PP@pandora.be'
+
+# Watch folder daemon: every .gcode file that lands in the spool directory is processed by a pool of worker
+# processes that is started once, so python and the P2PP modules are only loaded when the daemon starts.
+# The output (and the MAF/MSF file) goes to the output directory, together with a log file per job.
+
+import glob
+import multiprocessing
+import os
+import signal
+import sys
+import time
+
+try:
+    from time import monotonic
+except ImportError:
+    # python version 2.x
+    from time import time as monotonic
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    # python version 2.x without the futures backport, jobs are processed one after the other
+    ProcessPoolExecutor = None
+
+import p2pp.batch as batch
+
+PATTERN = "*.gcode"
+POLL_INTERVAL = 1.0  # seconds between two scans of the spool directory
+SETTLE_TIME = 2.0  # a file is complete when its size and time stamp did not change for this many seconds
+
+
+def file_signature(filename):
+    try:
+        info = os.stat(filename)
+    except OSError:
+        return None
+    return info.st_size, info.st_mtime
+
+
+def is_processed(input_file, output_file):
+    # a restarted daemon leaves files alone when their output is newer
+    try:
+        return os.path.getmtime(output_file) >= os.path.getmtime(input_file)
+    except OSError:
+        return False
+
+
+def ignore_interrupt():
+    # Ctrl-C stops the daemon, the workers finish the job they are working on
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class FolderWatcher(object):
+    # Polls the spool directory, the slicer is still writing a file as long as its size or time stamp changes.
+    # Every version of a file is handed out once, a file that is exported again is processed again when the job
+    # for the previous version has finished.
+
+    def __init__(self, watch_dir, output_dir, settle_time=SETTLE_TIME):
+        self.watch_dir = watch_dir
+        self.output_dir = output_dir
+        self.settle_time = settle_time
+        self.changing = {}  # filename -> (signature, time the signature was first seen)
+        self.handled = {}  # filename -> signature of the version that was handed out
+
+    def scan(self, now, busy=()):
+        ready = []
+        files = set(glob.glob(os.path.join(self.watch_dir, PATTERN)))
+
+        for filename in sorted(files):
+            signature = file_signature(filename)
+            if signature is None or signature[0] == 0 or self.handled.get(filename) == signature:
+                continue
+
+            previous = self.changing.get(filename)
+            if previous is None or previous[0] != signature:
+                self.changing[filename] = (signature, now)
+            elif now - previous[1] >= self.settle_time and filename not in busy:
+                del self.changing[filename]
+                self.handled[filename] = signature
+                if not is_processed(filename, batch.output_name(filename, self.output_dir)):
+                    ready.append(filename)
+
+        # forget about files that were removed
+        for table in (self.changing, self.handled):
+            for filename in list(table):
+                if filename not in files:
+                    del table[filename]
+
+        return ready
+
+
+def run(watch_dir, output_dir, workers=0, printer_profile="", splice_offset=40.0, log_dir=None,
+        poll_interval=POLL_INTERVAL, settle_time=SETTLE_TIME):
+    if not log_dir:
+        log_dir = output_dir
+    for directory in (output_dir, log_dir):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    if workers <= 0:
+        workers = multiprocessing.cpu_count()
+
+    pool = None
+    if ProcessPoolExecutor is not None:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=ignore_interrupt)
+    else:
+        workers = 1
+
+    watcher = FolderWatcher(watch_dir, output_dir, settle_time)
+    running = {}  # future -> input file
+
+    print("Watching {} for {} files, output to {} using {} worker(s) - Ctrl-C to stop".format(watch_dir, PATTERN,
+                                                                                         output_dir, workers))
+    batch.print_header()
+    sys.stdout.flush()
+
+    try:
+        while True:
+            for input_file in watcher.scan(monotonic(), set(running.values())):
+                job = (input_file,
+                       batch.output_name(input_file, output_dir),
+                       printer_profile,
+                       splice_offset,
+                       os.path.join(log_dir, os.path.basename(input_file) + ".log"))
+                if pool is None:
+                    batch.print_job(batch.process_file(*job))
+                else:
+                    running[pool.submit(batch.process_file, *job)] = input_file
+
+            for future in [future for future in running if future.done()]:
+                del running[future]
+                batch.print_job(future.result())
+
+            sys.stdout.flush()
+            time.sleep(poll_interval)
+
+    except KeyboardInterrupt:
+        print("Stopping, waiting for {} running job(s)".format(len(running)))
+
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True)
+            for future in running:
+                batch.print_job(future.result())
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+__author__ = 'Tom Van den Eede'
+__copyright__ = 'Copyright 2018-2020, Palette2 Splicer Post Processing Project'
+__credits__ = ['Tom Van den Eede',
+               'Tim Brookman'
+               ]
+__license__ = 'GPLv3'
+__maintainer__ = 'Tom Van den Eede'
+__email__ = 'P2PP@pandora.be'
+
+# Thin client for the resident P2PP server (P2PP.py --serve), to be used as post processing script in the slicer.
+# It only imports a few standard modules and leaves the work to the server.  When no server is running, the file
+# is processed by starting P2PP.py as usual.
+
+import json
+import os
+import socket
+import sys
+
+SOCKET_PATH = os.path.join(os.path.expanduser("~"), ".p2pp.sock")  # same as p2pp/server.py
+
+
+def usage():
+    print("usage: p2ppclient.py [-d output-file] [-p printer-profile] [-o splice-offset] [-l log-file] input-file")
+    sys.exit(2)
+
+
+def parse_arguments(argv):
+    options = {"output": None, "printer_profile": "", "splice_offset": 40.0, "log": None}
+    keys = {"-d": "output", "-p": "printer_profile", "-o": "splice_offset", "-l": "log", "-i": "input"}
+    while argv:
+        option = argv.pop(0)
+        if option in keys and argv:
+            options[keys[option]] = argv.pop(0)
+        elif not option.startswith("-") and "input" not in options:
+            options["input"] = option
+        else:
+            usage()
+    if "input" not in options:
+        usage()
+
+    options["splice_offset"] = float(options["splice_offset"])
+    for key in ("input", "output", "log"):
+        if options[key]:
+            # the server runs in another directory
+            options[key] = os.path.abspath(options[key])
+    return options
+
+
+def run_local(options):
+    arguments = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "P2PP.py"),
+                 "-i", options["input"], "-p", options["printer_profile"], "-o", str(options["splice_offset"])]
+    if options["output"]:
+        arguments += ["-d", options["output"]]
+    os.execv(sys.executable, arguments)
+
+
+def main(argv):
+    options = parse_arguments(argv)
+
+    try:
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.connect(SOCKET_PATH)
+    except (AttributeError, socket.error):
+        run_local(options)
+
+    conn.sendall((json.dumps(options) + "\n").encode("utf-8"))
+    data = b""
+    while True:
+        chunk = conn.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    conn.close()
+
+    if not data:
+        print("P2PP server did not return a result")
+        return 1
+
+    result = json.loads(data.decode("utf-8"))
+    print("{}: {}".format(options["input"], result["status"]))
+    if result.get("error"):
+        print("    " + result["error"])
+    for warning in result.get("warnings", []):
+        print("    " + warning)
+    return 1 if result["status"] == "error" else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))